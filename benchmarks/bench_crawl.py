@@ -0,0 +1,176 @@
+"""Benchmark de ponta a ponta contra o site sintético.
+
+Sobe benchmarks/synthetic_site.py numa porta local e roda o SeriesSpider nos
+modos collect, download e update (após publicar capítulos novos), cada um
+num processo próprio. Mede páginas/s, imagens/s, pico de RSS e tempo de CPU
+do processo do crawl e grava o resultado em JSON em benchmarks/results/,
+identificado pelo commit, para comparar execuções entre commits.
+
+Uso:
+    python benchmarks/bench_crawl.py [--series 50] [--chapters 10] [--pages 20] [--image-host localhost]
+                                     [--baseline benchmarks/results/anterior.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+sys.path.insert(0, BENCH_DIR)
+
+from synthetic_site import SyntheticSite, serve
+
+MODES = ('collect', 'download', 'update')
+HTML_KINDS = ('listing', 'series', 'chapter')
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'desconhecido'
+
+
+def run_mode(mode: str, base_url: str, workdir: str, settings: dict) -> dict:
+    """Roda um modo do spider num processo filho e mede tempo, CPU e RSS"""
+    command = [
+        sys.executable, '-m', 'scrapy', 'crawl', 'series_spider',
+        '-a', f'mode={mode}', '-a', f'base_url={base_url}',
+    ]
+    for key, value in settings.items():
+        command += ['-s', f'{key}={value}']
+
+    env = dict(os.environ, SCRAPY_SETTINGS_MODULE='scraper.settings')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_DIR, env.get('PYTHONPATH')]))
+
+    started = time.perf_counter()
+    with open(os.path.join(workdir, f'{mode}.log'), 'w') as log:
+        process = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 devolve o uso de recursos só deste filho
+        _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+
+    return {
+        'exit_code': os.waitstatus_to_exitcode(status),
+        'wall_seconds': round(elapsed, 3),
+        'cpu_user_seconds': round(usage.ru_utime, 3),
+        'cpu_system_seconds': round(usage.ru_stime, 3),
+        # ru_maxrss vem em KB no Linux e em bytes no macOS
+        'peak_rss_mb': round(usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+    }
+
+
+def bench(args) -> dict:
+    site = SyntheticSite(args.series, args.chapters, args.pages, image_size=(args.width, args.height),
+                         image_host=args.image_host)
+    server = serve(site)
+    base_url = f'http://127.0.0.1:{server.server_port}/manga/'
+
+    settings = {
+        'LOG_LEVEL': 'INFO',
+        'METRICS_PORT': 0,
+        'DOWNLOAD_DELAY': 0,
+        'RANDOMIZE_DOWNLOAD_DELAY': False,
+        'AUTOTHROTTLE_ENABLED': False,
+    }
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='bench_crawl_') as workdir:
+        for mode in MODES:
+            if mode == 'update':
+                # Lançamentos novos para o modo update encontrar
+                site.publish([f"serie-{i}" for i in range(1, args.updated + 1)])
+            site.reset_counters()
+
+            result = run_mode(mode, base_url, workdir, settings)
+            html = sum(site.requests[kind] for kind in HTML_KINDS)
+            images = site.requests['image']
+            wall = result['wall_seconds'] or 1e-9
+            result.update({
+                'html_pages': html,
+                'images': images,
+                'bytes': site.bytes_sent,
+                'pages_per_second': round(html / wall, 2),
+                'images_per_second': round(images / wall, 2),
+                'megabytes_per_second': round(site.bytes_sent / wall / 1024 / 1024, 2),
+            })
+            results[mode] = result
+            print(
+                f"{mode:>8}: {result['wall_seconds']:7.2f} s | {result['pages_per_second']:7.1f} páginas/s | "
+                f"{result['images_per_second']:7.1f} imagens/s | RSS {result['peak_rss_mb']:6.1f} MB | "
+                f"CPU {result['cpu_user_seconds'] + result['cpu_system_seconds']:6.2f} s"
+                + (f" | saída {result['exit_code']}" if result['exit_code'] else '')
+            )
+
+    server.shutdown()
+    params = {
+        'series': args.series, 'chapters': args.chapters, 'pages': args.pages,
+        'updated': args.updated, 'image_size': [args.width, args.height],
+    }
+    if args.image_host:
+        params['image_host'] = args.image_host
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'params': params,
+        'modes': results,
+    }
+
+
+def compare(current: dict, baseline_path: str):
+    """Mostra a variação em relação a um resultado anterior"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('params') != current['params']:
+        print("Aviso: parâmetros diferentes do baseline; a comparação é apenas indicativa")
+
+    print(f"\nComparação com {baseline.get('commit')} ({os.path.basename(baseline_path)}):")
+    for mode in MODES:
+        old, new = baseline['modes'].get(mode), current['modes'].get(mode)
+        if not old or not new:
+            continue
+        parts = []
+        for key in ('wall_seconds', 'images_per_second', 'peak_rss_mb', 'cpu_user_seconds'):
+            if old.get(key):
+                parts.append(f"{key} {(new[key] - old[key]) / old[key] * 100:+.1f}%")
+        print(f"{mode:>8}: " + ' | '.join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do crawl contra o site sintético')
+    parser.add_argument('--series', type=int, default=50, help='Séries no site')
+    parser.add_argument('--chapters', type=int, default=10, help='Capítulos por série')
+    parser.add_argument('--pages', type=int, default=20, help='Imagens por capítulo')
+    parser.add_argument('--updated', type=int, default=5, help='Séries com capítulo novo no modo update')
+    parser.add_argument('--width', type=int, default=720, help='Largura das imagens')
+    parser.add_argument('--height', type=int, default=1100, help='Altura das imagens')
+    parser.add_argument('--image-host', help='Serve as imagens por outro nome de host (ex.: localhost), como um CDN')
+    parser.add_argument('--output', help='Arquivo JSON de saída (padrão: benchmarks/results/<data>_<commit>.json)')
+    parser.add_argument('--baseline', help='Resultado anterior para comparação')
+    args = parser.parse_args()
+
+    result = bench(args)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{result['commit']}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResultado salvo em {output}")
+
+    if args.baseline:
+        compare(result, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
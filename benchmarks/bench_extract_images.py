@@ -0,0 +1,102 @@
+"""Micro-benchmark do extract_images contra HTML de capítulo salvo.
+
+Compara a extração antiga (até dois seletores CSS por índice) com a
+passada única do SeriesSpider sobre os arquivos em benchmarks/fixtures.
+
+Uso:
+    python benchmarks/bench_extract_images.py [arquivo.html ...] [-n 200]
+"""
+import argparse
+import glob
+import os
+import sys
+import timeit
+from urllib.parse import urljoin
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy.http import HtmlResponse
+
+from scraper.spiders.series_spider import SeriesSpider
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+CHAPTER_URL = 'https://hiper.cool/manga/exemplo/capitulo-87/'
+
+
+def legacy_extract_images(response) -> list:
+    """Implementação anterior: dois seletores por índice de 1 a 299"""
+    images = []
+    page_number = 1
+
+    for i in range(1, 300):
+        padded_num = str(i).zfill(2)
+        sel_full = response.css(f'#image-{padded_num}')
+        sel_short = response.css(f'#image-{i}')
+
+        if not sel_full and not sel_short:
+            break
+
+        sel = sel_full if sel_full else sel_short
+        img_url = sel.xpath('@src').get()
+
+        if img_url:
+            images.append({
+                'url': urljoin(response.url, img_url.strip()),
+                'page': page_number
+            })
+            page_number += 1
+
+    return images
+
+
+def load_response(path: str) -> HtmlResponse:
+    with open(path, 'rb') as f:
+        return HtmlResponse(url=CHAPTER_URL, body=f.read(), encoding='utf-8')
+
+
+def bench(path: str, number: int, spider: SeriesSpider) -> dict:
+    # Cada execução usa uma resposta nova para não aproveitar o cache do seletor
+    body = load_response(path).body
+
+    def fresh():
+        return HtmlResponse(url=CHAPTER_URL, body=body, encoding='utf-8')
+
+    legacy = legacy_extract_images(fresh())
+    current = spider.extract_images(fresh())
+    if [(image['page'], image['url']) for image in legacy] != list(current):
+        raise SystemExit(f"{path}: resultados divergentes ({len(legacy)} x {len(current)} imagens)")
+
+    legacy_time = min(timeit.repeat(lambda: legacy_extract_images(fresh()), number=number, repeat=3))
+    current_time = min(timeit.repeat(lambda: spider.extract_images(fresh()), number=number, repeat=3))
+
+    return {
+        'file': os.path.basename(path),
+        'images': len(current),
+        'legacy_ms': legacy_time / number * 1000,
+        'single_pass_ms': current_time / number * 1000,
+        'speedup': legacy_time / current_time
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do extract_images')
+    parser.add_argument('files', nargs='*', help='Arquivos HTML de capítulo (padrão: benchmarks/fixtures/*.html)')
+    parser.add_argument('--number', '-n', type=int, default=200, help='Execuções por medição')
+    args = parser.parse_args()
+
+    files = args.files or sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html')))
+    # O extract_images não depende do estado do spider
+    spider = SeriesSpider.__new__(SeriesSpider)
+
+    for path in files:
+        result = bench(path, args.number, spider)
+        print(
+            f"{result['file']}: {result['images']} imagens | "
+            f"antigo {result['legacy_ms']:.3f} ms | "
+            f"passada única {result['single_pass_ms']:.3f} ms | "
+            f"{result['speedup']:.1f}x mais rápido"
+        )
+
+
+if __name__ == '__main__':
+    main()
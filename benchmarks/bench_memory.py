@@ -0,0 +1,189 @@
+"""Benchmark de memória para séries muito longas.
+
+Compara o formato antigo (lista inteira de capítulos no meta de cada
+requisição e um dict por página no ChapterItem) com o atual (tabela de
+capítulos guardada uma vez no spider e ChapterPages) de duas formas:
+
+- em processo: bytes do meta serializado com pickle, como na fila em disco
+  (SCHEDULER_DISK_QUEUE), e memória alocada pelos registros de páginas;
+- de ponta a ponta: pico de RSS do SeriesSpider baixando uma série
+  sintética de 5000 capítulos com JOBDIR (fila em disco ativa).
+
+Para o "antes" de ponta a ponta, rode o script num checkout do commit
+anterior (ex.: git worktree) e passe o JSON com --baseline.
+
+Uso:
+    python benchmarks/bench_memory.py [--chapters 5000] [--pages 20] [--skip-crawl]
+                                      [--baseline benchmarks/results/anterior.json]
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from bench_crawl import git_commit, run_mode
+from synthetic_site import SyntheticSite, serve
+
+SERIES_URL = 'https://hiper.cool/manga/serie-longa/'
+
+
+def chapter_links(chapters: int) -> list:
+    return [f"/manga/serie-longa/capitulo-{n}/" for n in range(chapters, 0, -1)]
+
+
+def page_urls(chapter: int, pages: int) -> list:
+    # Caminho no formato do CDN do WP-Manga: um hash por série e por capítulo
+    chapter_hash = hashlib.md5(str(chapter).encode()).hexdigest()
+    return [
+        f"https://cdn.hiper.cool/wp-content/uploads/WP-manga/data/manga_64f1a2b3c4d5e/{chapter_hash}/{page:02d}.jpg"
+        for page in range(1, pages + 1)
+    ]
+
+
+def legacy_meta(links: list, index: int) -> dict:
+    """Meta de um capítulo no formato antigo (lista de capítulos em cada requisição)"""
+    return {
+        'series_title': 'Serie Longa',
+        'unit_links': links,
+        'index': index,
+        'original_url': SERIES_URL,
+        'update_mode': False,
+    }
+
+
+def current_meta(links: list, index: int) -> dict:
+    return {
+        'series_title': 'Serie Longa',
+        'index': index,
+        'original_url': SERIES_URL,
+        'update_mode': False,
+        'unit_url': f"https://hiper.cool{links[index]}",
+    }
+
+
+def legacy_pages(urls: list) -> list:
+    return [{'url': url, 'page': page} for page, url in enumerate(urls, start=1)]
+
+
+def allocated(build) -> int:
+    """Bytes alocados e ainda vivos ao fim de build()"""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def bench_in_process(chapters: int, pages: int) -> dict:
+    from scraper.items import ChapterPages
+
+    links = chapter_links(chapters)
+    # O meta só muda pelo índice: a média de algumas amostras vale para todos
+    samples = range(0, chapters, max(1, chapters // 20))
+    legacy_bytes = sum(len(pickle.dumps(legacy_meta(links, i))) for i in samples) / len(samples)
+    current_bytes = sum(len(pickle.dumps(current_meta(links, i))) for i in samples) / len(samples)
+
+    legacy_records = allocated(lambda: [legacy_pages(page_urls(c, pages)) for c in range(1, chapters + 1)])
+    current_records = allocated(lambda: [ChapterPages(page_urls(c, pages)) for c in range(1, chapters + 1)])
+
+    return {
+        'meta_bytes_per_request': {'legacy': round(legacy_bytes), 'current': round(current_bytes)},
+        'meta_megabytes_whole_series': {
+            'legacy': round(legacy_bytes * chapters / 1024 / 1024, 1),
+            'current': round(current_bytes * chapters / 1024 / 1024, 1),
+        },
+        'page_records_megabytes': {
+            'legacy': round(legacy_records / 1024 / 1024, 1),
+            'current': round(current_records / 1024 / 1024, 1),
+        },
+    }
+
+
+def bench_crawl(chapters: int, pages: int) -> dict:
+    # Imagens pequenas: o que interessa é a memória do crawl, não a transferência
+    site = SyntheticSite(series=1, chapters=chapters, pages=pages, image_size=(64, 96))
+    server = serve(site)
+    base_url = f'http://127.0.0.1:{server.server_port}/manga/'
+
+    settings = {
+        'LOG_LEVEL': 'WARNING',
+        'METRICS_PORT': 0,
+        'DOWNLOAD_DELAY': 0,
+        'RANDOMIZE_DOWNLOAD_DELAY': False,
+        'AUTOTHROTTLE_ENABLED': False,
+        'HTTPCACHE_ENABLED': False,
+        'JOBDIR': 'job',
+    }
+    with tempfile.TemporaryDirectory(prefix='bench_memory_') as workdir:
+        run_mode('collect', base_url, workdir, settings)
+        site.reset_counters()
+        result = run_mode('download', base_url, workdir, settings)
+    server.shutdown()
+
+    result.update({'chapters': site.requests['chapter'], 'images': site.requests['image']})
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de memória para séries longas')
+    parser.add_argument('--chapters', type=int, default=5000, help='Capítulos da série sintética')
+    parser.add_argument('--pages', type=int, default=20, help='Imagens por capítulo')
+    parser.add_argument('--skip-crawl', action='store_true', help='Só a medição em processo')
+    parser.add_argument('--output', help='Arquivo JSON de saída (padrão: benchmarks/results/<data>_<commit>_memory.json)')
+    parser.add_argument('--baseline', help='Resultado anterior para comparar o pico de RSS')
+    args = parser.parse_args()
+
+    in_process = bench_in_process(args.chapters, args.pages)
+    for key, values in in_process.items():
+        print(f"{key:>30}: antigo {values['legacy']:>12} | atual {values['current']:>12}")
+
+    result = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': sys.version.split()[0],
+        'params': {'chapters': args.chapters, 'pages': args.pages},
+        'in_process': in_process,
+    }
+
+    if not args.skip_crawl:
+        crawl = bench_crawl(args.chapters, args.pages)
+        result['crawl'] = crawl
+        print(
+            f"{'crawl':>30}: {crawl['wall_seconds']:.1f} s | RSS {crawl['peak_rss_mb']:.1f} MB | "
+            f"{crawl['chapters']} capítulos | {crawl['images']} imagens"
+            + (f" | saída {crawl['exit_code']}" if crawl['exit_code'] else '')
+        )
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{result['commit']}_memory.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResultado salvo em {output}")
+
+    if args.baseline and 'crawl' in result:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        old = (baseline.get('crawl') or {}).get('peak_rss_mb')
+        if old:
+            new = result['crawl']['peak_rss_mb']
+            print(f"Pico de RSS: {old:.1f} MB -> {new:.1f} MB ({(new - old) / old * 100:+.1f}%) "
+                  f"em relação a {baseline.get('commit')}")
+
+
+if __name__ == '__main__':
+    main()
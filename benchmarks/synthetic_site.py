@@ -0,0 +1,193 @@
+"""Site sintético no formato do hiper.cool para benchmarks offline.
+
+Serve listagens (div.page-listing-item, a.nextpostslink, wp-pagenavi),
+páginas de série com links de capítulos e páginas de capítulo com imagens
+#image-NN. As imagens são JPEGs gerados uma vez com o Pillow, no tamanho
+de páginas reais de mangá. Com image_host as imagens são servidas por
+outro nome de host (ex.: localhost), como um CDN separado do site.
+
+Uso avulso:
+    python benchmarks/synthetic_site.py [--port 8765] [--series 50] [--chapters 10] [--pages 20]
+                                        [--image-host localhost]
+"""
+import argparse
+import hashlib
+import io
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+from PIL import Image
+
+SERIES_RE = re.compile(r'^/manga/([\w-]+)/$')
+CHAPTER_RE = re.compile(r'^/manga/([\w-]+)/capitulo-(\d+)/$')
+LISTING_RE = re.compile(r'^/manga/(?:page/(\d+)/)?$')
+IMAGE_RE = re.compile(r'^/img/([\w-]+)/(\d+)/(\d+)\.jpg$')
+
+# HTML repetido das páginas do WordPress, para o parse ter um tamanho realista
+BOILERPLATE = ''.join(
+    f'<div class="widget"><a href="/genero/g{i}/">Gênero {i}</a><script>var x{i} = {i};</script></div>'
+    for i in range(200)
+)
+
+
+def generate_images(count: int = 4, size=(720, 1100), quality: int = 85) -> List[bytes]:
+    """JPEGs com gradiente e ruído (~300-400 KB, como páginas digitalizadas)"""
+    images = []
+    for index in range(count):
+        gradient = Image.linear_gradient('L').rotate(index * 90).resize(size)
+        noise = Image.effect_noise(size, 40 + index * 10)
+        image = Image.blend(gradient, noise, 0.5).convert('RGB')
+        buf = io.BytesIO()
+        image.save(buf, 'JPEG', quality=quality)
+        images.append(buf.getvalue())
+    return images
+
+
+class SyntheticSite:
+    """Estado do site: séries, capítulos publicados e contadores de requisições"""
+
+    def __init__(self, series: int = 50, chapters: int = 10, pages: int = 20, per_page: int = 20,
+                 image_size=(720, 1100), image_host: str = None):
+        self.pages = pages
+        self.image_host = image_host
+        self.per_page = per_page
+        self.chapters: Dict[str, int] = {f"serie-{i}": chapters for i in range(1, series + 1)}
+        # Ordem da listagem de lançamentos: a série atualizada mais recentemente primeiro
+        self.latest: List[str] = list(reversed(list(self.chapters)))
+        self.images = generate_images(size=image_size)
+        self.requests = Counter()
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    def publish(self, slugs: List[str]):
+        """Publica um capítulo novo em cada série e as leva ao topo dos lançamentos"""
+        with self.lock:
+            for slug in slugs:
+                self.chapters[slug] += 1
+                self.latest.remove(slug)
+                self.latest.insert(0, slug)
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests.clear()
+            self.bytes_sent = 0
+
+    def listing(self, page: int, latest: bool) -> str:
+        slugs = self.latest if latest else list(self.chapters)
+        last_page = max(1, -(-len(slugs) // self.per_page))
+        order = 'latest' if latest else 'views'
+        items = ''.join(
+            f'<div class="page-listing-item"><div class="page-item-detail">'
+            f'<h3><a href="/manga/{slug}/">{slug.replace("-", " ").title()}</a></h3>'
+            f'<span class="chapter"><a href="/manga/{slug}/capitulo-{self.chapters[slug]}/">Capítulo {self.chapters[slug]}</a></span>'
+            f'</div></div>'
+            for slug in slugs[(page - 1) * self.per_page:page * self.per_page]
+        )
+        nav = f'<div class="wp-pagenavi"><a class="last" href="/manga/page/{last_page}/?m_orderby={order}">Última</a>'
+        if page < last_page:
+            nav += f'<a class="nextpostslink" href="/manga/page/{page + 1}/?m_orderby={order}">»</a>'
+        return f'<html><body>{BOILERPLATE}{items}{nav}</div></body></html>'
+
+    def series(self, slug: str) -> str:
+        links = ''.join(
+            f'<li class="wp-manga-chapter"><a href="/manga/{slug}/capitulo-{n}/">Capítulo {n}</a></li>'
+            for n in range(self.chapters[slug], 0, -1)
+        )
+        title = slug.replace('-', ' ').title()
+        return f'<html><body>{BOILERPLATE}<h1>{title}</h1><ul class="main version-chap">{links}</ul></body></html>'
+
+    def chapter(self, slug: str, number: int, port: int = None) -> str:
+        image_base = f"http://{self.image_host}:{port}" if self.image_host else ''
+        images = ''.join(
+            f'<div class="page-break"><img id="image-{page:02d}" data-src="{image_base}/img/{slug}/{number}/{page}.jpg" '
+            f'class="wp-manga-chapter-img"></div>'
+            for page in range(1, self.pages + 1)
+        )
+        return f'<html><body>{BOILERPLATE}<div class="reading-content">{images}</div></body></html>'
+
+    def image(self, slug: str, number: int, page: int) -> bytes:
+        key = int(hashlib.md5(f"{slug}/{number}/{page}".encode()).hexdigest(), 16)
+        return self.images[key % len(self.images)]
+
+
+class SiteHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, kind: str, body: bytes, content_type: str = 'text/html; charset=utf-8',
+              etag: str = None, code: int = 200):
+        site = self.server.site
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            body = b''
+        else:
+            self.send_response(code)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            if etag:
+                self.send_header('ETag', etag)
+            self.end_headers()
+            self.wfile.write(body)
+        with site.lock:
+            site.requests[kind] += 1
+            site.bytes_sent += len(body)
+
+    def do_GET(self):
+        site = self.server.site
+        path, _, query = self.path.partition('?')
+
+        if match := IMAGE_RE.match(path):
+            slug, number, page = match.group(1), int(match.group(2)), int(match.group(3))
+            if slug in site.chapters and number <= site.chapters[slug] and page <= site.pages:
+                return self._send('image', site.image(slug, number, page), 'image/jpeg')
+        elif match := LISTING_RE.match(path):
+            page = int(match.group(1) or 1)
+            return self._send('listing', site.listing(page, 'latest' in query).encode('utf-8'))
+        elif match := CHAPTER_RE.match(path):
+            slug, number = match.group(1), int(match.group(2))
+            if slug in site.chapters and number <= site.chapters[slug]:
+                return self._send('chapter', site.chapter(slug, number, self.server.server_port).encode('utf-8'))
+        elif match := SERIES_RE.match(path):
+            slug = match.group(1)
+            if slug in site.chapters:
+                body = site.series(slug).encode('utf-8')
+                return self._send('series', body, etag=f'"{hashlib.md5(body).hexdigest()}"')
+
+        self._send('not_found', b'not found', code=404)
+
+
+def serve(site: SyntheticSite, port: int = 0) -> ThreadingHTTPServer:
+    """Sobe o servidor numa thread; a porta escolhida fica em server.server_port"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), SiteHandler)
+    server.daemon_threads = True
+    server.site = site
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Site sintético para benchmarks')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--series', type=int, default=50)
+    parser.add_argument('--chapters', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--image-host', help='Nome de host das imagens (ex.: localhost)')
+    args = parser.parse_args()
+
+    site = SyntheticSite(args.series, args.chapters, args.pages, image_host=args.image_host)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), SiteHandler)
+    server.site = site
+    print(f"Servindo em http://127.0.0.1:{args.port}/manga/")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,65 +1,169 @@
 import argparse
-import asyncio
+import queue
+import threading
+from scrapy import signals
 from scrapy.crawler import CrawlerProcess
 from scrapy.utils.project import get_project_settings
+from twisted.internet.threads import deferToThread
+from scraper.media import sniff_image_format
+from scraper.pipelines import image_site_headers
 from scraper.spiders.series_spider import SeriesSpider
 import os
 import requests
+from requests.adapters import HTTPAdapter
 from pathlib import Path
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Pipelines que gravam imagens: neste modo quem baixa é o MangaScraper
+STANDALONE_DISABLED_PIPELINES = (
+    'scraper.pipelines.ImageDownloadPipeline',
+    'scraper.pipelines.TranscodePipeline',
+)
+
+IMAGE_HEADERS = {
+    'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+
+
 class MangaScraper:
-    def __init__(self):
+    """Raspagem com download das imagens em paralelo ao crawl
+
+    Cada capítulo raspado é convertido em tarefas de página e entra numa fila
+    limitada; um pool de threads com sessões keep-alive (um pool de conexões
+    por host) consome a fila enquanto o crawl continua. Quando a fila enche,
+    o sinal item_scraped espera vaga e o crawl desacelera.
+    """
+
+    def __init__(self, output_dir="downloads", mode="download", workers=8, queue_size=256):
+        self.output_dir = output_dir
+        self.mode = mode
+        self.workers = workers
         self.settings = get_project_settings()
+        pipelines = dict(self.settings.getdict('ITEM_PIPELINES'))
+        for name in STANDALONE_DISABLED_PIPELINES:
+            pipelines.pop(name, None)
+        self.settings.set('ITEM_PIPELINES', pipelines)
         self.process = CrawlerProcess(self.settings)
-        self.results = []
+
+        self.tasks = queue.Queue(maxsize=queue_size)
+        self.local = threading.local()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.stats = {'chapters': 0, 'downloaded': 0, 'skipped': 0, 'failed': 0}
 
     def setup_crawler(self):
-        self.process.crawl(
-            SeriesSpider,
-            start_url='https://hiper.cool/',
-            callback=self.handle_item
-        )
-
-    def handle_item(self, item):
-        """Callback para processar cada item raspado"""
-        self.results.append(item)
+        crawler = self.process.create_crawler(SeriesSpider)
+        crawler.signals.connect(self.handle_item, signal=signals.item_scraped)
+        self.process.crawl(crawler, mode=self.mode)
+
+    def handle_item(self, item, response, spider):
+        """Enfileira as páginas do capítulo; o Deferred segura o crawl se a fila estiver cheia"""
         logger.info(f"Capturado: {item['series_title']} - Capítulo {item['chapter']}")
+        with self.lock:
+            self.stats['chapters'] += 1
+
+        clean_title = "".join(c if c.isalnum() or c in (' -_') else '_' for c in item['series_title'])
+        chapter_dir = Path(self.output_dir) / clean_title / f"Capitulo_{item['chapter']}"
+        tasks = [(chapter_dir, page, url) for page, url in item['images']]
+        return deferToThread(self._enqueue, tasks)
 
-    def download_images(self, output_dir="downloads"):
-        """Download das imagens capturadas"""
-        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    def _enqueue(self, tasks):
+        for task in tasks:
+            self.tasks.put(task)
+
+    def _session(self) -> requests.Session:
+        """Sessão da thread, com conexões reaproveitadas por host"""
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=self.workers, max_retries=2)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers.update(IMAGE_HEADERS)
+            session.headers.update(image_site_headers(
+                SeriesSpider.default_base_url, self.settings.get('IMAGE_REFERER'), self.settings.get('IMAGE_ORIGIN')
+            ))
+            self.local.session = session
+        return session
+
+    def _worker(self):
+        while True:
+            task = self.tasks.get()
+            try:
+                if task is None:
+                    return
+                self.download_image(*task)
+            finally:
+                self.tasks.task_done()
+
+    def download_image(self, chapter_dir: Path, page: int, url: str):
+        """Baixa uma página, pulando as que já existem no diretório do capítulo"""
+        prefix = f"pagina_{page:03d}."
+        if chapter_dir.is_dir() and any(name.startswith(prefix) for name in os.listdir(chapter_dir)):
+            self._count('skipped')
+            return
+
+        try:
+            response = self._session().get(url, timeout=30)
+            if response.status_code != 200:
+                logger.error(f"Erro ao baixar {url}: {response.status_code}")
+                self._count('failed')
+                return
+
+            ext = sniff_image_format(response.content)
+            if ext is None:
+                logger.error(f"Conteúdo não reconhecido como imagem: {url}")
+                self._count('failed')
+                return
 
-        for item in self.results:
-            series_dir = Path(output_dir) / item['series_title']
-            chapter_dir = series_dir / f"capitulo_{item['chapter']}"
             chapter_dir.mkdir(parents=True, exist_ok=True)
+            image_path = chapter_dir / f"{prefix}{ext}"
+            tmp_path = image_path.with_name(f"{image_path.name}.tmp")
+            tmp_path.write_bytes(response.content)
+            os.replace(tmp_path, image_path)
+            self._count('downloaded')
+            logger.debug(f"Baixado: {image_path}")
+        except Exception as e:
+            logger.error(f"Falha ao baixar {url}: {str(e)}")
+            self._count('failed')
+
+    def _count(self, key: str):
+        with self.lock:
+            self.stats[key] += 1
 
-            for image in item['images']:
-                image_path = chapter_dir / f"pagina_{image['page']:03d}.jpg"
+    def start_workers(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"download-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
 
-                try:
-                    response = requests.get(image['url'], timeout=30)
-                    if response.status_code == 200:
-                        image_path.write_bytes(response.content)
-                        logger.info(f"Baixado: {image_path}")
-                    else:
-                        logger.error(f"Erro ao baixar {image['url']}: {response.status_code}")
-                except Exception as e:
-                    logger.error(f"Falha ao baixar {image['url']}: {str(e)}")
+    def stop_workers(self):
+        for _ in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
 
     def run(self):
-        """Executa o scraping"""
+        """Executa o scraping com o download em paralelo"""
         logger.info("Iniciando scraping...")
+        Path(self.output_dir).mkdir(parents=True, exist_ok=True)
+        self.start_workers()
         self.setup_crawler()
         self.process.start()
 
-        if self.results:
-            logger.info("Iniciando download das imagens...")
-            self.download_images()
+        logger.info("Crawl finalizado; aguardando downloads pendentes...")
+        self.stop_workers()
+
+        if self.stats['chapters']:
+            logger.info(
+                f"{self.stats['chapters']} capítulos: {self.stats['downloaded']} imagens baixadas, "
+                f"{self.stats['skipped']} já existentes, {self.stats['failed']} falhas"
+            )
         else:
             logger.warning("Nenhum resultado encontrado")
 
@@ -67,9 +171,16 @@ def main():
     parser = argparse.ArgumentParser(description='Manga Image Scraper')
     parser.add_argument('--output', '-o', default='downloads',
                       help='Diretório de saída para as imagens (padrão: downloads)')
+    parser.add_argument('--mode', '-m', default='download', choices=['download', 'update'],
+                      help='Modo do spider (padrão: download)')
+    parser.add_argument('--workers', '-w', type=int, default=8,
+                      help='Downloads simultâneos (padrão: 8)')
+    parser.add_argument('--queue-size', type=int, default=256,
+                      help='Páginas aguardando download no máximo (padrão: 256)')
     args = parser.parse_args()
 
-    scraper = MangaScraper()
+    scraper = MangaScraper(output_dir=args.output, mode=args.mode, workers=args.workers,
+                           queue_size=args.queue_size)
     scraper.run()
 
 if __name__ == "__main__":
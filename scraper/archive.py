@@ -0,0 +1,123 @@
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_EXT = '.cbz'
+
+
+def archive_path(series: str, chapter) -> str:
+    """Caminho relativo do CBZ de um capítulo: Serie/Capitulo_N.cbz"""
+    return f"{series}/Capitulo_{chapter}{ARCHIVE_EXT}"
+
+
+def split_archive_path(path: str) -> Optional[Tuple[str, str]]:
+    """Separa 'Serie/Capitulo_N.cbz/pagina_001.jpg' em (arquivo, entrada)"""
+    marker = f"{ARCHIVE_EXT}/"
+    if marker not in path:
+        return None
+    archive, member = path.split(marker, 1)
+    return f"{archive}{ARCHIVE_EXT}", member
+
+
+class ChapterArchive:
+    """CBZ de um capítulo gravado em fluxo, na ordem das páginas
+
+    As páginas são escritas em Capitulo_N.cbz.part assim que chegam na ordem.
+    Páginas adiantadas esperam num buffer em memória limitado a max_buffer
+    bytes; acima disso vão para arquivos temporários. Páginas que já estavam
+    no CBZ anterior (retomada) são copiadas dele quando chega a vez delas.
+    """
+
+    def __init__(self, basedir: str, relative_path: str, carried: Dict[int, str] = None,
+                 max_buffer: int = 32 * 1024 * 1024):
+        self.path = os.path.join(basedir, relative_path)
+        self.part_path = f"{self.path}.part"
+        self.max_buffer = max_buffer
+        self.buffered_bytes = 0
+        self.next_page = 1
+        self.written = 0
+        # página -> ('mem', nome, bytes) | ('file', nome, arquivo) | ('old', nome, None)
+        self.pending: Dict[int, tuple] = {}
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.previous = None
+        if carried and os.path.isfile(self.path):
+            try:
+                self.previous = zipfile.ZipFile(self.path)
+                names = set(self.previous.namelist())
+                for page, name in carried.items():
+                    if name in names:
+                        self.pending[page] = ('old', name, None)
+            except zipfile.BadZipFile:
+                logger.warning(f"CBZ inválido, páginas anteriores descartadas: {self.path}")
+                self.previous = None
+
+        self.zip = zipfile.ZipFile(self.part_path, 'w', compression=zipfile.ZIP_STORED)
+        self._drain()
+
+    def add(self, page: int, name: str, data: bytes):
+        """Recebe uma página; grava agora se for a próxima da sequência"""
+        if page < self.next_page or page in self.pending:
+            return
+        if page == self.next_page:
+            self.zip.writestr(name, data)
+            self.written += 1
+            self.next_page += 1
+            self._drain()
+            return
+
+        if self.buffered_bytes + len(data) <= self.max_buffer:
+            self.pending[page] = ('mem', name, data)
+            self.buffered_bytes += len(data)
+        else:
+            spool = tempfile.TemporaryFile()
+            spool.write(data)
+            self.pending[page] = ('file', name, spool)
+
+    def _drain(self):
+        """Grava as páginas em espera que já estão na vez"""
+        while self.next_page in self.pending:
+            self._write_pending(self.next_page)
+            self.next_page += 1
+
+    def _write_pending(self, page: int):
+        kind, name, source = self.pending.pop(page)
+        if kind == 'mem':
+            self.zip.writestr(name, source)
+            self.buffered_bytes -= len(source)
+        elif kind == 'file':
+            source.seek(0)
+            with self.zip.open(name, 'w') as dest:
+                shutil.copyfileobj(source, dest)
+            source.close()
+        else:
+            with self.previous.open(name) as src, self.zip.open(name, 'w') as dest:
+                shutil.copyfileobj(src, dest)
+        self.written += 1
+
+    def finish(self) -> int:
+        """Grava o que falta (pulando páginas que falharam) e publica o CBZ"""
+        for page in sorted(self.pending):
+            self._write_pending(page)
+        self.zip.close()
+        if self.previous is not None:
+            self.previous.close()
+        os.replace(self.part_path, self.path)
+        return self.written
+
+    def abort(self):
+        """Descarta o .part e mantém o CBZ anterior intacto"""
+        for kind, _, source in self.pending.values():
+            if kind == 'file':
+                source.close()
+        self.pending.clear()
+        self.zip.close()
+        if self.previous is not None:
+            self.previous.close()
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
@@ -0,0 +1,147 @@
+import heapq
+import itertools
+
+from scrapy.core.downloader import Downloader
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.utils.httpobj import urlparse_cached
+from twisted.internet import defer
+
+# Classes de host: 'html' para as páginas do site, 'image' para os hosts
+# (em geral CDNs) de onde vêm as páginas dos capítulos
+HOST_CLASSES = ('html', 'image')
+
+
+def request_host_class(request) -> str:
+    """Classe de host da requisição (meta 'host_class'; padrão 'html')"""
+    return request.meta.get('host_class', 'html')
+
+
+def host_class_key(request) -> str:
+    """Host prefixado pela classe, exceto para 'html': 'image:cdn.exemplo.com'
+
+    Separa as imagens do HTML mesmo quando os dois vêm do mesmo host.
+    """
+    host = urlparse_cached(request).hostname or ''
+    host_class = request_host_class(request)
+    return host if host_class == 'html' else f"{host_class}:{host}"
+
+
+class PriorityRequestQueue:
+    """Fila de um slot do downloader ordenada por request.priority
+
+    Substitui o deque FIFO do Scrapy: requisições de maior prioridade saem
+    primeiro e, no empate, vale a ordem de chegada. As imagens baixadas pelo
+    pipeline não passam pelo scheduler, então é só aqui que a prioridade
+    delas conta.
+    """
+    __slots__ = ('heap', 'counter')
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+
+    def append(self, entry):
+        request = entry[0]
+        heapq.heappush(self.heap, (-request.priority, next(self.counter), entry))
+
+    def popleft(self):
+        return heapq.heappop(self.heap)[2]
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+
+class PriorityDownloader(Downloader):
+    """Downloader cujos slots atendem as requisições por prioridade
+
+    Cada classe de host tem seus próprios slots, com a concorrência de
+    <CLASSE>_HOST_CONCURRENCY (DOWNLOAD_SLOTS ainda vale para um slot
+    específico). Assim um limite baixo no host do HTML não segura as imagens.
+    CONCURRENT_REQUESTS conta só o HTML: imagens em voo ou na fila dos slots
+    não impedem o scheduler de enviar páginas.
+    """
+
+    def __init__(self, crawler):
+        super().__init__(crawler)
+        self.html_active = 0
+        self.class_concurrency = {
+            host_class: self.settings.getint(f'{host_class.upper()}_HOST_CONCURRENCY') or self.domain_concurrency
+            for host_class in HOST_CLASSES
+        }
+
+    def fetch(self, request, spider):
+        if request_host_class(request) != 'html':
+            return super().fetch(request, spider)
+        self.html_active += 1
+        dfd = super().fetch(request, spider)
+        dfd.addBoth(self._html_done)
+        return dfd
+
+    def _html_done(self, result):
+        self.html_active -= 1
+        return result
+
+    def needs_backout(self) -> bool:
+        return self.html_active >= self.total_concurrency
+
+    def _get_slot_key(self, request, spider):
+        if self.DOWNLOAD_SLOT in request.meta or self.ip_concurrency:
+            return super()._get_slot_key(request, spider)
+        return host_class_key(request)
+
+    def _get_slot(self, request, spider):
+        key, slot = super()._get_slot(request, spider)
+        if not isinstance(slot.queue, PriorityRequestQueue):
+            # Slot recém-criado (ou recriado após a coleta de slots ociosos): a fila ainda está vazia
+            slot.queue = PriorityRequestQueue()
+            if 'concurrency' not in self.per_slot_settings.get(key, {}):
+                slot.concurrency = self.class_concurrency.get(request_host_class(request), slot.concurrency)
+        return key, slot
+
+
+class HostClassDownloadHandler:
+    """Handler HTTP(S) com um pool de conexões keep-alive por classe de host
+
+    O pool de cada classe guarda até <CLASSE>_HOST_POOL_SIZE conexões
+    ociosas por host. Com <CLASSE>_HOST_HTTP2 as requisições https da classe
+    são multiplexadas numa conexão HTTP/2 por host (requer Twisted[http2]);
+    http e requisições com proxy continuam em HTTP/1.1.
+    """
+    lazy = False
+
+    def __init__(self, settings, crawler=None):
+        self.http11 = {}
+        self.http2 = {}
+        for host_class in HOST_CLASSES:
+            prefix = host_class.upper()
+            handler = HTTP11DownloadHandler(settings, crawler)
+            pool_size = settings.getint(f'{prefix}_HOST_POOL_SIZE')
+            if pool_size:
+                handler._pool.maxPersistentPerHost = pool_size
+            self.http11[host_class] = handler
+            if settings.getbool(f'{prefix}_HOST_HTTP2'):
+                self.http2[host_class] = self._http2_handler(settings, crawler, prefix)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler)
+
+    @staticmethod
+    def _http2_handler(settings, crawler, prefix):
+        try:
+            from scrapy.core.downloader.handlers.http2 import H2DownloadHandler
+        except ImportError as e:
+            raise ImportError(f"{prefix}_HOST_HTTP2 requer o pacote h2 (pip install Twisted[http2])") from e
+        return H2DownloadHandler(settings, crawler)
+
+    def download_request(self, request, spider):
+        host_class = request_host_class(request)
+        http2 = self.http2.get(host_class)
+        # O handler HTTP/2 do Scrapy não passa por proxy nem fala h2c
+        if http2 and urlparse_cached(request).scheme == 'https' and not request.meta.get('proxy'):
+            return http2.download_request(request, spider)
+        return self.http11.get(host_class, self.http11['html']).download_request(request, spider)
+
+    def close(self):
+        handlers = [*self.http11.values(), *self.http2.values()]
+        return defer.DeferredList([defer.maybeDeferred(handler.close) for handler in handlers])
@@ -0,0 +1,553 @@
+import logging
+import os
+import socket
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterable, List
+from urllib.parse import urlparse
+
+from scraper.state import COMPLETED, DEFERRED, LEASED, PENDING, CrawlState
+
+logger = logging.getLogger(__name__)
+
+
+def default_node_id(cache_dir: str) -> str:
+    """Identificação estável do nó: o mesmo host e cache retomam os próprios aluguéis"""
+    return f"{socket.gethostname()}:{os.path.abspath(cache_dir)}"
+
+
+def open_frontier(settings, state: CrawlState, cache_dir: str):
+    """Abre a fronteira configurada em FRONTIER_URL
+
+    Sem FRONTIER_URL a fronteira é o próprio state.db local; sqlite:///caminho
+    usa um banco compartilhado entre processos da mesma máquina (ou de um
+    disco compartilhado com lock confiável) e redis://host:porta/db um
+    servidor Redis (ou compatível) para vários nós.
+    """
+    url = settings.get('FRONTIER_URL')
+    if not url:
+        return LocalFrontier(state)
+
+    node_id = settings.get('FRONTIER_NODE_ID') or default_node_id(cache_dir)
+    lease_seconds = settings.getint('FRONTIER_LEASE_SECONDS', 300)
+    scheme = urlparse(url).scheme
+
+    if scheme == 'sqlite':
+        path = url[len('sqlite:///'):] if url.startswith('sqlite:///') else url[len('sqlite://'):]
+        return SQLiteFrontier(path, node_id, lease_seconds)
+    if scheme in ('redis', 'rediss', 'unix'):
+        return RedisFrontier(url, node_id, lease_seconds, prefix=settings.get('FRONTIER_PREFIX', 'scraper'))
+    raise ValueError(f"FRONTIER_URL com esquema não suportado: {url}")
+
+
+class LocalFrontier:
+    """Fronteira de um único processo sobre o CrawlState
+
+    Os aluguéis não expiram e os de capítulos não são necessários: o aluguel
+    da série já garante que só este processo baixa os seus capítulos.
+    """
+
+    shared = False
+    node_id = 'local'
+
+    def __init__(self, state: CrawlState):
+        self.state = state
+
+    def add_series(self, urls: Iterable[str]) -> List[str]:
+        return self.state.add_series(urls)
+
+    def series_count(self) -> int:
+        return self.state.series_count()
+
+    def is_completed(self, url: str) -> bool:
+        return self.state.is_completed(url)
+
+    def completed_series(self) -> List[str]:
+        return self.state.completed_series()
+
+    def leased_series(self) -> List[str]:
+        return self.state.leased_series()
+
+    def count_with_status(self, status: str) -> int:
+        return self.state.count_with_status(status)
+
+    def lease_next(self, limit: int) -> List[str]:
+        return self.state.lease_next(limit)
+
+    def complete(self, url: str):
+        self.state.complete(url)
+
+    def release(self, url: str):
+        self.state.release(url)
+
+    def reset_deferred(self):
+        self.state.reset_deferred()
+
+    def leased_elsewhere(self) -> int:
+        return 0
+
+    def lease_chapter(self, url: str, series_url: str) -> bool:
+        return True
+
+    def complete_chapter(self, url: str):
+        pass
+
+    def release_chapter(self, url: str):
+        pass
+
+    def renew(self):
+        pass
+
+    def close(self):
+        # O state.db é fechado pelo spider
+        pass
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    url TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    owner TEXT,
+    expires_at REAL,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_series_status ON series (status, position);
+CREATE INDEX IF NOT EXISTS idx_series_owner ON series (owner, status);
+CREATE TABLE IF NOT EXISTS chapters (
+    url TEXT PRIMARY KEY,
+    series_url TEXT,
+    status TEXT NOT NULL,
+    owner TEXT,
+    expires_at REAL,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chapters_owner ON chapters (owner, status);
+"""
+
+
+class SQLiteFrontier:
+    """Fronteira compartilhada num arquivo SQLite
+
+    Cada aluguel guarda o nó dono e o instante em que expira; o nó renova os
+    seus periodicamente (renew) e qualquer nó assume aluguéis vencidos ao
+    pedir novas séries. Um capítulo com aluguel vencido devolve a sua série
+    à fila, já que a série é concluída antes de as imagens terminarem. A
+    contagem de 'leased' considera só os aluguéis deste nó, e a de
+    'pending' inclui os aluguéis vencidos de outros nós.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, node_id: str, lease_seconds: int = 300):
+        self.path = path
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def _expiry(self) -> float:
+        return time.time() + self.lease_seconds
+
+    def add_series(self, urls: Iterable[str]) -> List[str]:
+        """Adiciona séries no fim da fila e retorna as que nenhum nó tinha visto"""
+        added = []
+        with self.transaction() as conn:
+            position = conn.execute('SELECT COALESCE(MAX(position), 0) FROM series').fetchone()[0]
+            for url in urls:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO series (url, position, status) VALUES (?, ?, ?)',
+                    (url, position + 1, PENDING)
+                )
+                if cursor.rowcount:
+                    position += 1
+                    added.append(url)
+        return added
+
+    def series_count(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM series').fetchone()[0]
+
+    def is_completed(self, url: str) -> bool:
+        row = self.conn.execute('SELECT status FROM series WHERE url = ?', (url,)).fetchone()
+        return bool(row) and row[0] == COMPLETED
+
+    def completed_series(self) -> List[str]:
+        return [
+            row[0] for row in self.conn.execute(
+                'SELECT url FROM series WHERE status = ? ORDER BY position', (COMPLETED,)
+            )
+        ]
+
+    def leased_series(self) -> List[str]:
+        """Séries alugadas por este nó (retomadas após um reinício)"""
+        return [
+            row[0] for row in self.conn.execute(
+                'SELECT url FROM series WHERE status = ? AND owner = ? ORDER BY position',
+                (LEASED, self.node_id)
+            )
+        ]
+
+    def count_with_status(self, status: str) -> int:
+        if status == LEASED:
+            query, params = 'status = ? AND owner = ?', (LEASED, self.node_id)
+        elif status == PENDING:
+            query, params = 'status = ? OR (status = ? AND expires_at < ?)', (PENDING, LEASED, time.time())
+        else:
+            query, params = 'status = ?', (status,)
+        return self.conn.execute(f'SELECT COUNT(*) FROM series WHERE {query}', params).fetchone()[0]
+
+    def leased_elsewhere(self) -> int:
+        """Aluguéis de séries e capítulos de outros nós, vigentes ou vencidos"""
+        return sum(
+            self.conn.execute(
+                f'SELECT COUNT(*) FROM {table} WHERE status = ? AND owner != ?', (LEASED, self.node_id)
+            ).fetchone()[0]
+            for table in ('series', 'chapters')
+        )
+
+    def _reopen_expired_chapters(self, conn, now: float):
+        """Devolve à fila as séries cujos capítulos ficaram com aluguel vencido"""
+        rows = conn.execute(
+            'SELECT url, series_url, owner FROM chapters WHERE status = ? AND expires_at < ?', (LEASED, now)
+        ).fetchall()
+        for url, series_url, owner in rows:
+            conn.execute('DELETE FROM chapters WHERE url = ?', (url,))
+            cursor = conn.execute(
+                'UPDATE series SET status = ?, owner = NULL, expires_at = NULL WHERE url = ? AND status = ?',
+                (PENDING, series_url, COMPLETED)
+            )
+            if cursor.rowcount:
+                logger.info(f"Capítulo com aluguel vencido de {owner}: {series_url} volta à fila")
+
+    def lease_next(self, limit: int) -> List[str]:
+        """Aluga as próximas séries pendentes ou com aluguel vencido, na ordem da listagem"""
+        if limit <= 0:
+            return []
+
+        now = time.time()
+        with self.transaction() as conn:
+            self._reopen_expired_chapters(conn, now)
+            rows = conn.execute(
+                'SELECT url, owner FROM series WHERE status = ? OR (status = ? AND expires_at < ?) '
+                'ORDER BY position LIMIT ?',
+                (PENDING, LEASED, now, limit)
+            ).fetchall()
+            conn.executemany(
+                'UPDATE series SET status = ?, owner = ?, expires_at = ?, updated_at = ? WHERE url = ?',
+                [(LEASED, self.node_id, now + self.lease_seconds, datetime.now().isoformat(), url)
+                 for url, _ in rows]
+            )
+
+        for url, owner in rows:
+            if owner and owner != self.node_id:
+                logger.info(f"Aluguel vencido de {owner} assumido: {url}")
+        return [url for url, _ in rows]
+
+    def _set_status(self, url: str, status: str):
+        self.conn.execute(
+            'UPDATE series SET status = ?, owner = NULL, expires_at = NULL, updated_at = ? WHERE url = ?',
+            (status, datetime.now().isoformat(), url)
+        )
+
+    def complete(self, url: str):
+        self._set_status(url, COMPLETED)
+
+    def release(self, url: str):
+        """Libera o aluguel sem concluir; a série volta na próxima execução"""
+        self._set_status(url, DEFERRED)
+
+    def reset_deferred(self):
+        self.conn.execute('UPDATE series SET status = ? WHERE status = ?', (PENDING, DEFERRED))
+
+    def lease_chapter(self, url: str, series_url: str) -> bool:
+        """Aluga o capítulo; False se outro nó já o baixou ou está baixando"""
+        now = time.time()
+        with self.transaction() as conn:
+            row = conn.execute('SELECT status, owner, expires_at FROM chapters WHERE url = ?', (url,)).fetchone()
+            if row:
+                status, owner, expires_at = row
+                if status == COMPLETED:
+                    return False
+                if owner != self.node_id and expires_at and expires_at >= now:
+                    return False
+            conn.execute(
+                'INSERT OR REPLACE INTO chapters (url, series_url, status, owner, expires_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (url, series_url, LEASED, self.node_id, now + self.lease_seconds, datetime.now().isoformat())
+            )
+        return True
+
+    def complete_chapter(self, url: str):
+        self.conn.execute(
+            'UPDATE chapters SET status = ?, owner = NULL, expires_at = NULL, updated_at = ? WHERE url = ?',
+            (COMPLETED, datetime.now().isoformat(), url)
+        )
+
+    def release_chapter(self, url: str):
+        self.conn.execute(
+            'DELETE FROM chapters WHERE url = ? AND status = ? AND owner = ?', (url, LEASED, self.node_id)
+        )
+
+    def renew(self):
+        """Estende todos os aluguéis deste nó por mais FRONTIER_LEASE_SECONDS"""
+        expires_at = self._expiry()
+        with self.transaction() as conn:
+            for table in ('series', 'chapters'):
+                conn.execute(
+                    f'UPDATE {table} SET expires_at = ? WHERE status = ? AND owner = ?',
+                    (expires_at, LEASED, self.node_id)
+                )
+
+    def close(self):
+        self.conn.close()
+
+
+# Scripts Lua: cada operação de aluguel é atômica no servidor
+REDIS_ADD_SERIES = """
+local added = {}
+for _, url in ipairs(ARGV) do
+    if not redis.call('ZSCORE', KEYS[1], url) then
+        local position = redis.call('INCR', KEYS[3])
+        redis.call('ZADD', KEYS[1], position, url)
+        redis.call('ZADD', KEYS[2], position, url)
+        table.insert(added, url)
+    end
+end
+return added
+"""
+
+
+REDIS_LEASE_SERIES = """
+local now = tonumber(ARGV[1])
+-- Capítulos com aluguel vencido devolvem a série concluída à fila
+for _, url in ipairs(redis.call('ZRANGEBYSCORE', KEYS[5], '-inf', '(' .. ARGV[1])) do
+    local series_url = redis.call('HGET', KEYS[7], url)
+    redis.call('ZREM', KEYS[5], url)
+    redis.call('HDEL', KEYS[6], url)
+    redis.call('HDEL', KEYS[7], url)
+    if series_url and redis.call('SREM', KEYS[8], series_url) == 1 then
+        redis.call('ZADD', KEYS[1], redis.call('ZSCORE', KEYS[4], series_url), series_url)
+    end
+end
+-- Séries com aluguel vencido voltam para a fila na posição original
+for _, url in ipairs(redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', '(' .. ARGV[1])) do
+    redis.call('ZREM', KEYS[2], url)
+    redis.call('ZADD', KEYS[1], redis.call('ZSCORE', KEYS[4], url), url)
+end
+local leased = {}
+for _, url in ipairs(redis.call('ZRANGE', KEYS[1], 0, tonumber(ARGV[4]) - 1)) do
+    redis.call('ZREM', KEYS[1], url)
+    redis.call('ZADD', KEYS[2], ARGV[2], url)
+    local previous = redis.call('HGET', KEYS[3], url)
+    redis.call('HSET', KEYS[3], url, ARGV[3])
+    table.insert(leased, {url, previous or ''})
+end
+return leased
+"""
+
+REDIS_RESET_DEFERRED = """
+for _, url in ipairs(redis.call('SMEMBERS', KEYS[2])) do
+    redis.call('ZADD', KEYS[1], redis.call('ZSCORE', KEYS[3], url), url)
+end
+redis.call('DEL', KEYS[2])
+"""
+
+REDIS_LEASE_CHAPTER = """
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then
+    return 0
+end
+local owner = redis.call('HGET', KEYS[3], ARGV[1])
+local expires_at = redis.call('ZSCORE', KEYS[2], ARGV[1])
+if owner and owner ~= ARGV[2] and expires_at and tonumber(expires_at) >= tonumber(ARGV[4]) then
+    return 0
+end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[4], ARGV[1], ARGV[5])
+return 1
+"""
+
+# Renova (ARGV[3] > 0) ou libera (ARGV[3] == 0) os capítulos que ainda são deste nó
+REDIS_TOUCH_CHAPTERS = """
+for i = 4, #ARGV do
+    local url = ARGV[i]
+    if redis.call('HGET', KEYS[2], url) == ARGV[1] then
+        if ARGV[3] == '0' then
+            redis.call('ZREM', KEYS[1], url)
+            redis.call('HDEL', KEYS[2], url)
+            redis.call('HDEL', KEYS[3], url)
+        else
+            redis.call('ZADD', KEYS[1], ARGV[2], url)
+        end
+    end
+end
+"""
+
+
+class RedisFrontier:
+    """Fronteira compartilhada num servidor Redis (ou compatível)
+
+    Chaves (com FRONTIER_PREFIX): series:all e series:pending são sorted sets
+    pela posição na listagem; series:leases e chapters:leases guardam o
+    vencimento de cada aluguel, e os hashes *:owner o nó dono. Concluídas e
+    liberadas ficam em conjuntos (series:completed, series:deferred,
+    chapters:completed). As operações de aluguel são scripts Lua atômicos.
+    """
+
+    shared = True
+
+    SERIES_KEYS = ('all', 'pending', 'leases', 'owner', 'completed', 'deferred', 'seq')
+    CHAPTER_KEYS = ('leases', 'owner', 'series', 'completed')
+
+    def __init__(self, url: str, node_id: str, lease_seconds: int = 300, prefix: str = 'scraper'):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImportError("FRONTIER_URL redis:// requer o pacote redis (pip install redis)") from e
+
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.series = {name: f"{prefix}:series:{name}" for name in self.SERIES_KEYS}
+        self.chapter = {name: f"{prefix}:chapters:{name}" for name in self.CHAPTER_KEYS}
+        # Capítulos alugados por este nó, renovados junto com as séries
+        self.chapters = set()
+
+        self._add_series = self.client.register_script(REDIS_ADD_SERIES)
+        self._lease_series = self.client.register_script(REDIS_LEASE_SERIES)
+        self._reset_deferred = self.client.register_script(REDIS_RESET_DEFERRED)
+        self._lease_chapter = self.client.register_script(REDIS_LEASE_CHAPTER)
+        self._touch_chapters = self.client.register_script(REDIS_TOUCH_CHAPTERS)
+
+    def add_series(self, urls: Iterable[str]) -> List[str]:
+        urls = list(urls)
+        if not urls:
+            return []
+        return self._add_series(keys=[self.series['all'], self.series['pending'], self.series['seq']], args=urls)
+
+    def series_count(self) -> int:
+        return self.client.zcard(self.series['all'])
+
+    def is_completed(self, url: str) -> bool:
+        return bool(self.client.sismember(self.series['completed'], url))
+
+    def _by_position(self, urls: Iterable[str]) -> List[str]:
+        urls = list(urls)
+        if not urls:
+            return []
+        positions = self.client.zmscore(self.series['all'], urls)
+        return [url for _, url in sorted(zip(positions, urls), key=lambda pair: pair[0] or 0)]
+
+    def completed_series(self) -> List[str]:
+        return self._by_position(self.client.smembers(self.series['completed']))
+
+    def leased_series(self) -> List[str]:
+        """Séries alugadas por este nó (retomadas após um reinício)"""
+        owners = self.client.hgetall(self.series['owner'])
+        mine = [url for url, owner in owners.items() if owner == self.node_id]
+        if not mine:
+            return []
+        expires = self.client.zmscore(self.series['leases'], mine)
+        return self._by_position(url for url, expires_at in zip(mine, expires) if expires_at is not None)
+
+    def count_with_status(self, status: str) -> int:
+        if status == LEASED:
+            return len(self.leased_series())
+        if status == PENDING:
+            return (self.client.zcard(self.series['pending'])
+                    + self.client.zcount(self.series['leases'], '-inf', f'({time.time()}'))
+        if status == COMPLETED:
+            return self.client.scard(self.series['completed'])
+        if status == DEFERRED:
+            return self.client.scard(self.series['deferred'])
+        return 0
+
+    def leased_elsewhere(self) -> int:
+        """Aluguéis de séries e capítulos de outros nós, vigentes ou vencidos"""
+        chapters = self.client.zcard(self.chapter['leases']) - len(self.chapters)
+        return self.client.zcard(self.series['leases']) - len(self.leased_series()) + max(0, chapters)
+
+    def lease_next(self, limit: int) -> List[str]:
+        if limit <= 0:
+            return []
+
+        now = time.time()
+        leased = self._lease_series(
+            keys=[self.series['pending'], self.series['leases'], self.series['owner'], self.series['all'],
+                  self.chapter['leases'], self.chapter['owner'], self.chapter['series'], self.series['completed']],
+            args=[now, now + self.lease_seconds, self.node_id, limit]
+        )
+        for url, owner in leased:
+            if owner and owner != self.node_id:
+                logger.info(f"Aluguel de {owner} assumido: {url}")
+        return [url for url, _ in leased]
+
+    def _end_lease(self, url: str, status: str):
+        with self.client.pipeline() as pipe:
+            pipe.zrem(self.series['leases'], url)
+            pipe.hdel(self.series['owner'], url)
+            pipe.zrem(self.series['pending'], url)
+            pipe.srem(self.series['deferred'], url)
+            pipe.sadd(self.series[status], url)
+            pipe.execute()
+
+    def complete(self, url: str):
+        self._end_lease(url, 'completed')
+
+    def release(self, url: str):
+        self._end_lease(url, 'deferred')
+
+    def reset_deferred(self):
+        self._reset_deferred(keys=[self.series['pending'], self.series['deferred'], self.series['all']])
+
+    def lease_chapter(self, url: str, series_url: str) -> bool:
+        now = time.time()
+        leased = self._lease_chapter(
+            keys=[self.chapter['completed'], self.chapter['leases'], self.chapter['owner'], self.chapter['series']],
+            args=[url, self.node_id, now + self.lease_seconds, now, series_url]
+        )
+        if leased:
+            self.chapters.add(url)
+        return bool(leased)
+
+    def _touch(self, urls: List[str], expires_at: float):
+        self._touch_chapters(
+            keys=[self.chapter['leases'], self.chapter['owner'], self.chapter['series']],
+            args=[self.node_id, expires_at, 1 if expires_at else 0] + urls
+        )
+
+    def complete_chapter(self, url: str):
+        self.client.sadd(self.chapter['completed'], url)
+        self.release_chapter(url)
+
+    def release_chapter(self, url: str):
+        self.chapters.discard(url)
+        self._touch([url], 0)
+
+    def renew(self):
+        """Estende todos os aluguéis deste nó por mais FRONTIER_LEASE_SECONDS"""
+        expires_at = time.time() + self.lease_seconds
+        mine = self.leased_series()
+        if mine:
+            # XX: não recria aluguéis que outro nó já assumiu e concluiu
+            self.client.zadd(self.series['leases'], {url: expires_at for url in mine}, xx=True)
+        if self.chapters:
+            self._touch(list(self.chapters), expires_at)
+
+    def close(self):
+        self.client.close()
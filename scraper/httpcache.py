@@ -0,0 +1,176 @@
+import gzip
+import logging
+import os
+import pickle
+import sqlite3
+import time
+from typing import Optional
+from urllib.parse import urlparse
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+
+logger = logging.getLogger(__name__)
+
+CHAPTER_MARKERS = ('/capitulo-', '/vol-')
+
+
+def page_type(url: str) -> str:
+    """Classifica a URL: 'chapter', 'series', 'listing' ou 'other' (imagens etc.)"""
+    parsed = urlparse(url)
+    if any(marker in parsed.path for marker in CHAPTER_MARKERS):
+        return 'chapter'
+    segments = [s for s in parsed.path.split('/') if s]
+    if segments[:1] == ['manga']:
+        if len(segments) == 2 and segments[1] != 'page' and not parsed.query:
+            return 'series'
+        return 'listing'
+    return 'other'
+
+
+class PageTypeCachePolicy:
+    """Política de cache por tipo de página
+
+    Capítulos publicados não mudam e ficam no cache para sempre; páginas de
+    série expiram após HTTPCACHE_SERIES_TTL segundos (a validade é conferida
+    pelo storage); listagens, imagens e requisições condicionais do modo
+    update nunca usam o cache.
+    """
+
+    CACHEABLE_TYPES = ('chapter', 'series')
+
+    def __init__(self, settings):
+        self.ignore_http_codes = [int(x) for x in settings.getlist('HTTPCACHE_IGNORE_HTTP_CODES')]
+
+    def should_cache_request(self, request):
+        if page_type(request.url) not in self.CACHEABLE_TYPES:
+            return False
+        # O modo update já revalida a página da série por conta própria
+        return b'If-None-Match' not in request.headers and b'If-Modified-Since' not in request.headers
+
+    def should_cache_response(self, response, request):
+        return response.status == 200 and response.status not in self.ignore_http_codes
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        return True
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        return True
+
+
+class LRUFilesystemCacheStorage:
+    """Cache em disco comprimido com gzip e limitado por tamanho
+
+    Cada resposta fica num arquivo <dir>/ab/<fingerprint>.gz; um índice em
+    SQLite guarda tamanho, data de gravação e último acesso. Ao passar de
+    HTTPCACHE_MAX_BYTES, as entradas usadas há mais tempo são removidas até
+    o cache voltar a 90% do limite.
+    """
+
+    def __init__(self, settings):
+        self.cachedir = settings.get('HTTPCACHE_DIR', os.path.join('cache', 'httpcache'))
+        self.series_ttl = settings.getint('HTTPCACHE_SERIES_TTL', 3600)
+        self.max_bytes = settings.getint('HTTPCACHE_MAX_BYTES', 0)
+        self.compresslevel = 6 if settings.getbool('HTTPCACHE_GZIP', True) else 0
+        self.conn: Optional[sqlite3.Connection] = None
+        self.total_bytes = 0
+        self.stats = None
+        self.fingerprinter = None
+
+    def open_spider(self, spider):
+        os.makedirs(self.cachedir, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(self.cachedir, 'index.db'), isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, page_type TEXT NOT NULL, size INTEGER NOT NULL, '
+            'stored_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)')
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        self.stats = spider.crawler.stats
+        self.fingerprinter = spider.crawler.request_fingerprinter
+        logger.debug(f"Cache HTTP em {self.cachedir}: {self.total_bytes / 1024 / 1024:.1f} MB")
+
+    def close_spider(self, spider):
+        self.stats.set_value('httpcache/size_bytes', self.total_bytes, spider=spider)
+        self.conn.close()
+
+    def _key(self, request) -> str:
+        return self.fingerprinter.fingerprint(request).hex()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cachedir, key[:2], f"{key}.gz")
+
+    def retrieve_response(self, spider, request):
+        key = self._key(request)
+        row = self.conn.execute('SELECT page_type, stored_at FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        kind, stored_at = row
+        now = time.time()
+        if kind == 'series' and self.series_ttl and now - stored_at > self.series_ttl:
+            return None
+
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = pickle.loads(gzip.decompress(f.read()))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self._delete(key)
+            return None
+
+        self.conn.execute('UPDATE entries SET accessed_at = ? WHERE key = ?', (now, key))
+        headers = Headers(data['headers'])
+        respcls = responsetypes.from_args(headers=headers, url=data['url'], body=data['body'])
+        return respcls(url=data['url'], headers=headers, status=data['status'], body=data['body'])
+
+    def store_response(self, spider, request, response):
+        key = self._key(request)
+        payload = gzip.compress(pickle.dumps({
+            'url': response.url,
+            'status': response.status,
+            'headers': dict(response.headers),
+            'body': response.body,
+        }, protocol=pickle.HIGHEST_PROTOCOL), compresslevel=self.compresslevel)
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        previous = self.conn.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+        self.conn.execute(
+            'INSERT OR REPLACE INTO entries (key, page_type, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+            (key, page_type(request.url), len(payload), now, now)
+        )
+        self.total_bytes += len(payload) - (previous[0] if previous else 0)
+
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            self._evict(spider)
+
+    def _delete(self, key: str):
+        row = self.conn.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+        if row:
+            self.conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+            self.total_bytes -= row[0]
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, spider):
+        """Remove as entradas menos usadas recentemente até 90% do limite"""
+        target = self.max_bytes * 0.9
+        evicted = 0
+        rows = self.conn.execute('SELECT key FROM entries ORDER BY accessed_at').fetchall()
+        for (key,) in rows:
+            if self.total_bytes <= target:
+                break
+            self._delete(key)
+            evicted += 1
+        self.stats.inc_value('httpcache/evicted', evicted, spider=spider)
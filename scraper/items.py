@@ -1,5 +1,36 @@
+import os
+from typing import Iterable, Iterator, Tuple
+
 import scrapy
 
+
+class ChapterPages:
+    """Páginas de um capítulo em ordem, sem um dict por página
+
+    A página N é a N-ésima URL (extract_images já renumera em sequência) e
+    o prefixo comum das URLs, geralmente o diretório do capítulo no CDN,
+    é guardado uma única vez. Iterar produz (página, URL).
+    """
+    __slots__ = ('prefix', 'suffixes')
+
+    def __init__(self, urls: Iterable[str]):
+        urls = list(urls)
+        prefix = os.path.commonprefix(urls) if len(urls) > 1 else ''
+        self.prefix = prefix
+        self.suffixes = tuple(url[len(prefix):] for url in urls)
+
+    def __len__(self) -> int:
+        return len(self.suffixes)
+
+    def __iter__(self) -> Iterator[Tuple[int, str]]:
+        prefix = self.prefix
+        for page, suffix in enumerate(self.suffixes, start=1):
+            yield page, prefix + suffix
+
+    def __repr__(self) -> str:
+        return f"ChapterPages({len(self)} páginas, prefixo={self.prefix!r})"
+
+
 class ImageItem(scrapy.Item):
     image_url = scrapy.Field()
     source_url = scrapy.Field()
@@ -15,6 +46,9 @@ class ChapterItem(scrapy.Item):
     image_count = scrapy.Field()
     images = scrapy.Field()
     series_title = scrapy.Field()
+    series_url = scrapy.Field()
+    # URL do capítulo alugada na fronteira (vinda da página da série)
+    unit_url = scrapy.Field()
     # Campos usados pelo pipeline (baixar imagens, cálculo de checksum, etc.)
     path = scrapy.Field()
     status = scrapy.Field()
@@ -0,0 +1,167 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from typing import Iterator, List
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+HEX_SEGMENT_RE = re.compile(r'^[0-9a-f]{16,}$', re.IGNORECASE)
+DIGITS_RE = re.compile(r'\d+')
+
+
+class ErrorJournal:
+    """Journal de erros append-only em JSONL
+
+    As entradas ficam num buffer em memória e são gravadas em lote, quando o
+    buffer enche, quando o intervalo de flush expira ou no fechamento. O
+    arquivo é rotacionado ao atingir max_bytes (errors.jsonl.1, .2, ...).
+    """
+
+    def __init__(self, path: str, flush_interval: float = 5.0, max_buffer: int = 100,
+                 max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.buffer: List[str] = []
+        self.last_flush = time.monotonic()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def append(self, entry: dict):
+        self.buffer.append(json.dumps(entry, ensure_ascii=False))
+        if len(self.buffer) >= self.max_buffer or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Grava o buffer no fim do arquivo"""
+        self.last_flush = time.monotonic()
+        if not self.buffer:
+            return
+
+        lines, self.buffer = self.buffer, []
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+                size = f.tell()
+        except OSError as e:
+            logger.error(f"Erro ao gravar journal de erros: {e}")
+            return
+
+        if self.max_bytes and size >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        """Desloca errors.jsonl -> errors.jsonl.1 -> ... descartando o mais antigo"""
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self):
+        self.flush()
+
+
+def read_entries(path: str) -> Iterator[dict]:
+    """Lê o journal atual e os rotacionados, do mais antigo ao mais recente"""
+    rotated = []
+    for filepath in glob.glob(f"{glob.escape(path)}.*"):
+        suffix = filepath.rsplit('.', 1)[1]
+        if suffix.isdigit():
+            rotated.append((int(suffix), filepath))
+
+    for filepath in [p for _, p in sorted(rotated, reverse=True)] + [path]:
+        if not os.path.exists(filepath):
+            continue
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Linha truncada por uma interrupção durante o flush
+                    continue
+
+
+def url_pattern(url: str) -> str:
+    """Agrupa URLs semelhantes: números viram {n} e slugs/hashes viram *"""
+    parsed = urlparse(url)
+    segments = [s for s in parsed.path.split('/') if s]
+    pattern = []
+    for index, segment in enumerate(segments):
+        if index == 1 and segments[0] == 'manga' and segment != 'page':
+            pattern.append('*')
+        elif HEX_SEGMENT_RE.match(segment):
+            pattern.append('*')
+        else:
+            pattern.append(DIGITS_RE.sub('{n}', segment))
+    return f"{parsed.netloc}/{'/'.join(pattern)}"
+
+
+def summarize(path: str) -> dict:
+    """Resume os erros por padrão de URL e por tipo de exceção"""
+    by_pattern = Counter()
+    by_type = Counter()
+    by_pair = Counter()
+    total = 0
+    first = last = None
+
+    for entry in read_entries(path):
+        total += 1
+        pattern = url_pattern(entry.get('url', ''))
+        error_type = entry.get('error_type', 'desconhecido')
+        by_pattern[pattern] += 1
+        by_type[error_type] += 1
+        by_pair[(pattern, error_type)] += 1
+        first = first or entry.get('timestamp')
+        last = entry.get('timestamp') or last
+
+    return {
+        'total': total,
+        'first': first,
+        'last': last,
+        'by_pattern': by_pattern.most_common(),
+        'by_type': by_type.most_common(),
+        'by_pattern_and_type': [(p, t, c) for (p, t), c in by_pair.most_common()]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resumo do journal de erros')
+    parser.add_argument('path', nargs='?', default=os.path.join('cache', 'report', 'errors.jsonl'),
+                        help='Arquivo do journal (padrão: cache/report/errors.jsonl)')
+    parser.add_argument('--top', type=int, default=20, help='Quantidade de linhas por agrupamento')
+    parser.add_argument('--json', action='store_true', help='Imprime o resumo em JSON')
+    args = parser.parse_args()
+
+    summary = summarize(args.path)
+    if args.json:
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+        return
+
+    print(f"Total de erros: {summary['total']} ({summary['first']} -> {summary['last']})")
+    print("\nPor tipo de exceção:")
+    for error_type, count in summary['by_type'][:args.top]:
+        print(f"  {count:>8}  {error_type}")
+    print("\nPor padrão de URL:")
+    for pattern, count in summary['by_pattern'][:args.top]:
+        print(f"  {count:>8}  {pattern}")
+    print("\nPor padrão de URL e tipo:")
+    for pattern, error_type, count in summary['by_pattern_and_type'][:args.top]:
+        print(f"  {count:>8}  {error_type:<30} {pattern}")
+
+
+if __name__ == '__main__':
+    main()
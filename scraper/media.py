@@ -0,0 +1,161 @@
+import hashlib
+import os
+import shutil
+import time
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+# Tipo MIME de cada extensão reconhecida
+IMAGE_MIME_TYPES = {
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+    'bmp': 'image/bmp',
+}
+
+# Formatos de saída do transcode (extensão -> formato do Pillow)
+TRANSCODE_FORMATS = {
+    'webp': 'WEBP',
+    'avif': 'AVIF',
+    'png': 'PNG',
+    'jpg': 'JPEG',
+}
+
+
+def sniff_image_format(data: bytes) -> Optional[str]:
+    """Identifica o formato da imagem pelos primeiros bytes (sem decodificar)"""
+    head = data[:32]
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head[4:8] == b'ftyp' and head[8:12] in (b'avif', b'avis'):
+        return 'avif'
+    if head.startswith(b'BM'):
+        return 'bmp'
+    return None
+
+
+def image_is_complete(data: bytes, image_format: Optional[str] = None) -> bool:
+    """Confere se a imagem chegou inteira pelo marcador de fim do formato
+
+    JPEG termina em EOI (FF D9), PNG no chunk IEND, GIF no trailer 0x3B;
+    WebP e BMP são conferidos pelo tamanho declarado no cabeçalho.
+    """
+    image_format = image_format or sniff_image_format(data)
+    if image_format == 'jpg':
+        # Alguns encoders deixam preenchimento depois do EOI
+        return data.rstrip(b'\x00\r\n ').endswith(b'\xff\xd9')
+    if image_format == 'png':
+        return b'IEND' in data[-16:]
+    if image_format == 'gif':
+        return data.rstrip(b'\x00').endswith(b'\x3b')
+    if image_format == 'webp':
+        return len(data) >= int.from_bytes(data[4:8], 'little') + 8
+    if image_format == 'bmp':
+        return len(data) >= int.from_bytes(data[2:6], 'little')
+    return True
+
+
+def merkle_root(hashes: List[str]) -> str:
+    """Raiz Merkle (SHA-256) dos hashes das páginas, na ordem das páginas"""
+    if not hashes:
+        return hashlib.sha256(b'').hexdigest()
+
+    level = [bytes.fromhex(h) for h in hashes]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 de um arquivo lido em blocos"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    """Armazenamento endereçado por conteúdo (SHA-256 dos bytes)
+
+    Cada conteúdo é gravado uma única vez em <base>/.blobs/ab/cd/<hash>.<ext>;
+    o layout Serie/Capitulo_N/pagina_NNN.ext aponta para o blob por hardlink.
+    """
+
+    def __init__(self, basedir: str, blobs_dir: str = '.blobs'):
+        self.basedir = basedir
+        self.root = os.path.join(basedir, blobs_dir)
+        self.link_supported = True
+
+    def blob_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root, digest[:2], digest[2:4], f"{digest}.{ext}")
+
+    def put(self, data: bytes, ext: str, digest: Optional[str] = None) -> Tuple[str, str, bool]:
+        """Grava o blob se ainda não existir; retorna (hash, caminho, novo)"""
+        digest = digest or hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest, ext)
+        if os.path.exists(path):
+            return digest, path, False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return digest, path, True
+
+    def link(self, blob_path: str, relative_path: str) -> bool:
+        """Aponta o caminho do layout para o blob; copia se hardlink não for suportado"""
+        dest = os.path.join(self.basedir, relative_path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp_dest = f"{dest}.{os.getpid()}.tmp"
+        if os.path.lexists(tmp_dest):
+            os.remove(tmp_dest)
+
+        linked = False
+        if self.link_supported:
+            try:
+                os.link(blob_path, tmp_dest)
+                linked = True
+            except OSError:
+                # Sistema de arquivos sem hardlinks: passa a copiar
+                self.link_supported = False
+        if not linked:
+            shutil.copyfile(blob_path, tmp_dest)
+
+        # Substitui de forma atômica uma página existente
+        os.replace(tmp_dest, dest)
+        return linked
+
+
+def transcode_image(path: str, image_format: str, quality: int = 80, lossless: bool = False) -> Tuple[Optional[bytes], float]:
+    """Recodifica uma imagem com o Pillow; roda nos processos do pool
+
+    Retorna (bytes recodificados, tempo de CPU). Os bytes voltam como None
+    quando o resultado não fica menor que o original.
+    """
+    from PIL import Image
+
+    started = time.process_time()
+    with open(path, 'rb') as f:
+        original = f.read()
+
+    with Image.open(BytesIO(original)) as image:
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        buf = BytesIO()
+        image.save(buf, TRANSCODE_FORMATS[image_format], quality=quality, lossless=lossless, method=4)
+
+    data = buf.getvalue()
+    cpu_time = time.process_time() - started
+    return (data if len(data) < len(original) else None), cpu_time
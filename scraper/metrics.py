@@ -0,0 +1,233 @@
+import bisect
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import reactor, task
+from twisted.web import resource, server
+
+from scraper.httpcache import page_type
+
+logger = logging.getLogger(__name__)
+
+# Sinal enviado pelos pipelines ao fim de cada etapa (stage, seconds)
+stage_completed = object()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 180.0)
+# Tempo de um capítulo inteiro, da requisição da página ao fim dos pipelines
+COMPLETION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+# Tipo de página (scraper.httpcache.page_type) -> tipo de requisição nas métricas
+REQUEST_TYPES = {'listing': 'listing', 'series': 'series', 'chapter': 'chapter', 'other': 'image'}
+
+
+def record_stage(crawler, stage: str, started: float):
+    """Informa a duração de uma etapa de pipeline iniciada em `started` (monotonic)"""
+    crawler.signals.send_catch_log(stage_completed, stage=stage, seconds=time.monotonic() - started)
+
+
+def metrics_summary(crawler):
+    """Resumo atual das métricas, ou None se a extensão estiver desativada
+
+    O spider_closed do spider roda antes do da extensão, então o relatório
+    consulta a extensão diretamente em vez de esperar pelas estatísticas.
+    """
+    for extension in getattr(crawler.extensions, 'middlewares', ()):
+        if isinstance(extension, MetricsExtension):
+            return extension.summary()
+    return None
+
+
+class Histogram:
+    """Histograma cumulativo no formato do Prometheus"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimativa pelo limite superior do bucket (como histogram_quantile)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound if bound != float('inf') else self.buckets[-1]
+        return self.buckets[-1]
+
+    def summary(self) -> dict:
+        return {
+            'count': self.count,
+            'avg': round(self.sum / self.count, 4) if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+        }
+
+    def prometheus(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class MetricsResource(resource.Resource):
+    isLeaf = True
+
+    def __init__(self, metrics):
+        super().__init__()
+        self.metrics = metrics
+
+    def render_GET(self, request):
+        request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+        return self.metrics.prometheus().encode('utf-8')
+
+
+class MetricsExtension:
+    """Bytes por host, latência por tipo de requisição, duração das etapas
+    dos pipelines e profundidade das filas
+
+    As métricas ficam em http://METRICS_HOST:METRICS_PORT/metrics no formato
+    texto do Prometheus; ao final um resumo vai para as estatísticas
+    (metrics/summary) e para o relatório do spider.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+
+        self.crawler = crawler
+        self.host = settings.get('METRICS_HOST', '127.0.0.1')
+        self.port = settings.getint('METRICS_PORT', 9410)
+        self.sample_interval = settings.getfloat('METRICS_SAMPLE_INTERVAL', 5.0)
+
+        self.bytes_by_host: Dict[str, int] = defaultdict(int)
+        self.latency: Dict[str, Histogram] = defaultdict(Histogram)
+        self.responses: Dict[Tuple[str, int], int] = defaultdict(int)
+        self.stages: Dict[str, Histogram] = defaultdict(Histogram)
+        self.queues: Dict[str, int] = {}
+        self.queues_max: Dict[str, int] = defaultdict(int)
+        self.started: Dict[object, float] = {}
+        self.listener = None
+        self.sampler = task.LoopingCall(self.sample_queues)
+
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(self.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(self.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(self.request_left_downloader, signal=signals.request_left_downloader)
+        crawler.signals.connect(self.bytes_received, signal=signals.bytes_received)
+        crawler.signals.connect(self.stage_completed, signal=stage_completed)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def spider_opened(self, spider):
+        if self.port:
+            try:
+                self.listener = reactor.listenTCP(self.port, server.Site(MetricsResource(self)), interface=self.host)
+                logger.info(f"Métricas em http://{self.host}:{self.port}/metrics")
+            except Exception as e:
+                logger.warning(f"Não foi possível abrir o endpoint de métricas na porta {self.port}: {e}")
+        self.sampler.start(self.sample_interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.sampler.running:
+            self.sampler.stop()
+        if self.listener is not None:
+            self.listener.stopListening()
+        self.crawler.stats.set_value('metrics/summary', self.summary(), spider=spider)
+
+    def request_reached_downloader(self, request, spider):
+        self.started[request] = time.monotonic()
+
+    def response_downloaded(self, response, request, spider):
+        started = self.started.get(request)
+        if started is None:
+            return
+        request_type = REQUEST_TYPES[page_type(request.url)]
+        self.latency[request_type].observe(time.monotonic() - started)
+        self.responses[(request_type, response.status)] += 1
+
+    def request_left_downloader(self, request, spider):
+        self.started.pop(request, None)
+
+    def bytes_received(self, data, request, spider):
+        self.bytes_by_host[urlparse(request.url).hostname or ''] += len(data)
+
+    def stage_completed(self, stage, seconds):
+        self.stages[stage].observe(seconds)
+
+    def sample_queues(self):
+        """Lê a profundidade das filas do engine e dos pipelines"""
+        engine = self.crawler.engine
+        if engine is None:
+            return
+        slot = getattr(engine, 'slot', None)
+        scraper = getattr(engine, 'scraper', None)
+        queues = {
+            'scheduler': len(slot.scheduler) if slot and hasattr(slot.scheduler, '__len__') else 0,
+            'downloader_active': len(engine.downloader.active),
+            'scraper_queue': len(scraper.slot.queue) if scraper and scraper.slot else 0,
+            'items_in_pipeline': scraper.slot.itemproc_size if scraper and scraper.slot else 0,
+        }
+        # Pipelines e o spider expõem as próprias filas em queue_depths()
+        for pipeline in getattr(getattr(scraper, 'itemproc', None), 'middlewares', ()):
+            if hasattr(pipeline, 'queue_depths'):
+                queues.update(pipeline.queue_depths())
+        if hasattr(getattr(engine, 'spider', None), 'queue_depths'):
+            queues.update(engine.spider.queue_depths())
+
+        self.queues = queues
+        for name, depth in queues.items():
+            self.queues_max[name] = max(self.queues_max[name], depth)
+
+    def summary(self) -> dict:
+        return {
+            'bytes_by_host': dict(self.bytes_by_host),
+            'latency_seconds': {name: hist.summary() for name, hist in sorted(self.latency.items())},
+            'stage_seconds': {name: hist.summary() for name, hist in sorted(self.stages.items())},
+            'max_queue_depth': dict(self.queues_max),
+        }
+
+    def prometheus(self) -> str:
+        lines = ['# TYPE scraper_bytes_received_total counter']
+        for host, count in sorted(self.bytes_by_host.items()):
+            lines.append(f'scraper_bytes_received_total{{host="{host}"}} {count}')
+
+        lines.append('# TYPE scraper_responses_total counter')
+        for (request_type, status), count in sorted(self.responses.items()):
+            lines.append(f'scraper_responses_total{{type="{request_type}",status="{status}"}} {count}')
+
+        lines.append('# TYPE scraper_request_latency_seconds histogram')
+        for request_type, hist in sorted(self.latency.items()):
+            lines.extend(hist.prometheus('scraper_request_latency_seconds', f'type="{request_type}"'))
+
+        lines.append('# TYPE scraper_stage_duration_seconds histogram')
+        for stage, hist in sorted(self.stages.items()):
+            lines.extend(hist.prometheus('scraper_stage_duration_seconds', f'stage="{stage}"'))
+
+        lines.append('# TYPE scraper_queue_depth gauge')
+        for name, depth in sorted(self.queues.items()):
+            lines.append(f'scraper_queue_depth{{queue="{name}"}} {depth}')
+        return '\n'.join(lines) + '\n'
@@ -1,17 +1,316 @@
 from scrapy import signals
-from scrapy.downloadermiddlewares.retry import RetryMiddleware
+from scrapy.downloadermiddlewares.retry import RetryMiddleware, get_retry_request
+from scrapy.exceptions import NotConfigured
+from email.utils import parsedate_to_datetime
+from scraper.downloader import host_class_key, request_host_class
+from scraper.media import image_is_complete, sniff_image_format
+from twisted.internet import reactor
+from twisted.internet.task import deferLater
+import hashlib
+import json
+import os
+import re
 import time
 
+CONTENT_RANGE_RE = re.compile(rb'bytes (\d+)-(\d+)/(\d+|\*)')
+
 
 class CustomRetryMiddleware(RetryMiddleware):
     def process_response(self, request, response, spider):
         if response.status == 429:
-            spider.logger.info("Recebido 429, aguardando antes de retry...")
-            time.sleep(30)
+            # A espera fica a cargo do AdaptiveRateLimitMiddleware, sem bloquear o reactor
+            spider.logger.info("Recebido 429, reagendando com limite de taxa...")
             reason = f'Rate limit atingido ({response.status})'
             return self._retry(request, reason, spider) or response
         return super().process_response(request, response, spider)
 
+
+class HostRateLimit:
+    """Token bucket de um host (GCRA) com taxa ajustada por AIMD"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        # Instante teórico em que o próximo token fica disponível
+        self.tat = 0.0
+        self.blocked_until = 0.0
+
+    def reserve(self, now: float) -> float:
+        """Reserva um token e retorna quantos segundos a requisição deve esperar"""
+        interval = 1.0 / self.rate
+        tolerance = (self.burst - 1) * interval
+        start = max(now, self.blocked_until)
+        self.tat = max(self.tat, start)
+        wait = max(start - now, self.tat - tolerance - now)
+        self.tat += interval
+        return wait
+
+    def throttle(self, now: float, retry_after: float, factor: float, min_rate: float):
+        """Diminuição multiplicativa após um 429"""
+        # Vários 429 da mesma janela contam como um único evento de congestionamento
+        if now >= self.blocked_until:
+            self.rate = max(min_rate, self.rate * factor)
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        self.tat = max(self.tat, self.blocked_until)
+
+    def recover(self, step: float, max_rate: float):
+        """Aumento aditivo: cerca de `step` req/s a mais por segundo de respostas saudáveis"""
+        self.rate = min(max_rate, self.rate + step / self.rate)
+
+
+class AdaptiveRateLimitMiddleware:
+    """Limita a taxa por host sem bloquear o reactor
+
+    Cada requisição reserva um token do host; se precisar esperar, o
+    middleware devolve um Deferred que dispara após o atraso, e o downloader
+    segue atendendo os demais hosts. Um 429 respeita o Retry-After e reduz a
+    taxa do host; respostas saudáveis a recuperam aos poucos.
+
+    Imagens e HTML têm baldes separados, mesmo no mesmo host: um 429 do site
+    não freia o CDN. Os hosts de imagens partem de RATELIMIT_IMAGE_START_RATE
+    e sobem até RATELIMIT_IMAGE_MAX_RATE.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('RATELIMIT_ENABLED'):
+            raise NotConfigured
+
+        self.stats = crawler.stats
+        self.start_rate = settings.getfloat('RATELIMIT_START_RATE', 50.0)
+        self.min_rate = settings.getfloat('RATELIMIT_MIN_RATE', 0.5)
+        self.max_rate = settings.getfloat('RATELIMIT_MAX_RATE', 50.0)
+        self.burst = max(1, settings.getint('RATELIMIT_BURST', 16))
+        self.decrease_factor = settings.getfloat('RATELIMIT_DECREASE_FACTOR', 0.5)
+        self.increase_step = settings.getfloat('RATELIMIT_INCREASE_STEP', 1.0)
+        self.default_retry_after = settings.getfloat('RATELIMIT_DEFAULT_RETRY_AFTER', 30.0)
+        self.max_retry_after = settings.getfloat('RATELIMIT_MAX_RETRY_AFTER', 300.0)
+        self.image_start_rate = settings.getfloat('RATELIMIT_IMAGE_START_RATE', self.start_rate)
+        self.image_max_rate = settings.getfloat('RATELIMIT_IMAGE_MAX_RATE', self.max_rate)
+        self.hosts = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _max_rate(self, request) -> float:
+        return self.image_max_rate if request_host_class(request) == 'image' else self.max_rate
+
+    def _host(self, request):
+        host = host_class_key(request)
+        if host not in self.hosts:
+            start_rate = self.image_start_rate if request_host_class(request) == 'image' else self.start_rate
+            self.hosts[host] = HostRateLimit(start_rate, self.burst)
+        return host, self.hosts[host]
+
+    def process_request(self, request, spider):
+        host, limit = self._host(request)
+        delay = limit.reserve(time.monotonic())
+        if delay <= 0:
+            return None
+
+        self.stats.inc_value('ratelimit/delayed_requests', spider=spider)
+        self.stats.inc_value('ratelimit/delay_seconds', delay, spider=spider)
+        return deferLater(reactor, delay, lambda: None)
+
+    def process_response(self, request, response, spider):
+        # Respostas do cache HTTP não dizem nada sobre o servidor
+        if 'cached' in response.flags:
+            return response
+
+        host, limit = self._host(request)
+
+        if response.status == 429 or (response.status == 503 and b'Retry-After' in response.headers):
+            retry_after = self._retry_after(response)
+            limit.throttle(time.monotonic(), retry_after, self.decrease_factor, self.min_rate)
+            self.stats.inc_value('ratelimit/throttled', spider=spider)
+            self.stats.inc_value(f'ratelimit/throttled/{host}', spider=spider)
+            spider.logger.info(
+                f"Limite de taxa em {host}: aguardando {retry_after:.0f}s, taxa reduzida para {limit.rate:.2f} req/s"
+            )
+        elif 200 <= response.status < 400:
+            limit.recover(self.increase_step, self._max_rate(request))
+
+        self.stats.set_value(f'ratelimit/rate/{host}', round(limit.rate, 2), spider=spider)
+        return response
+
+    def _retry_after(self, response) -> float:
+        """Interpreta o Retry-After em segundos ou como data HTTP"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return self.default_retry_after
+
+        value = value.decode('latin-1').strip()
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return self.default_retry_after
+        return min(max(seconds, 0.0), self.max_retry_after)
+
+class RangeResumeMiddleware:
+    """Retoma downloads de imagens interrompidos com HTTP Range
+
+    Os bytes de cada imagem (requisições com meta 'range_resume') são
+    gravados em cache/partial conforme chegam. Se a conexão cair ou der
+    timeout no meio, a próxima tentativa pede só o restante com
+    `Range: bytes=N-` (e If-Range, para não misturar versões). A resposta
+    só segue para o pipeline quando bate com o Content-Length e tem o
+    marcador de fim do formato; senão é tentada de novo.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('RANGE_RESUME_ENABLED'):
+            raise NotConfigured
+
+        self.stats = crawler.stats
+        self.partial_dir = settings.get('RANGE_RESUME_DIR', os.path.join('cache', 'partial'))
+        os.makedirs(self.partial_dir, exist_ok=True)
+        # requisição -> arquivo parcial aberto durante a transferência
+        self.active = {}
+
+        crawler.signals.connect(self.headers_received, signal=signals.headers_received)
+        crawler.signals.connect(self.bytes_received, signal=signals.bytes_received)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def _paths(self, request):
+        key = hashlib.sha1(request.url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.partial_dir, key)
+        return f"{base}.part", f"{base}.json"
+
+    def _load_meta(self, meta_path) -> dict:
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _discard(self, request):
+        for path in self._paths(request):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def process_request(self, request, spider):
+        if not request.meta.get('range_resume'):
+            return None
+
+        # Tentativas anteriores podem ter deixado um Range desatualizado
+        request.headers.pop('Range', None)
+        request.headers.pop('If-Range', None)
+        request.meta.pop('range_offset', None)
+
+        part_path, meta_path = self._paths(request)
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        meta = self._load_meta(meta_path)
+        if offset and meta.get('accept_ranges'):
+            request.headers['Range'] = f'bytes={offset}-'
+            validator = meta.get('etag') or meta.get('last_modified')
+            if validator:
+                request.headers['If-Range'] = validator
+            request.meta['range_offset'] = offset
+        return None
+
+    def headers_received(self, headers, body_length, request, spider):
+        if not request.meta.get('range_resume') or b'Content-Encoding' in headers:
+            return
+
+        part_path, meta_path = self._paths(request)
+        offset = request.meta.get('range_offset', 0)
+        content_range = CONTENT_RANGE_RE.match(headers.get('Content-Range') or b'')
+        appending = bool(offset and content_range and int(content_range.group(1)) == offset)
+        accept_ranges = headers.get('Accept-Ranges') == b'bytes' or appending
+
+        if not accept_ranges:
+            # Sem suporte a Range não há o que retomar
+            self._discard(request)
+            return
+
+        if appending:
+            total = content_range.group(3)
+            expected = int(total) if total != b'*' else None
+        else:
+            expected = int(headers['Content-Length']) if headers.get('Content-Length') else None
+
+        meta = {
+            'url': request.url,
+            'accept_ranges': True,
+            'etag': (headers.get('ETag') or b'').decode('latin-1') or None,
+            'last_modified': (headers.get('Last-Modified') or b'').decode('latin-1') or None,
+            'expected_length': expected,
+        }
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        self.active[request] = open(part_path, 'ab' if appending else 'wb')
+
+    def bytes_received(self, data, request, spider):
+        part = self.active.get(request)
+        if part is not None:
+            part.write(data)
+
+    def _close(self, request) -> bool:
+        part = self.active.pop(request, None)
+        if part is not None:
+            part.close()
+        return part is not None
+
+    def process_response(self, request, response, spider):
+        if not request.meta.get('range_resume'):
+            return response
+
+        tracked = self._close(request)
+        part_path, meta_path = self._paths(request)
+        if response.status not in (200, 206):
+            return response
+
+        body = response.body
+        expected = None
+        if response.status == 206:
+            if not tracked:
+                # Resposta parcial sem os bytes anteriores: começa de novo
+                self._discard(request)
+                return self._retry(request, spider, 'range_mismatch') or response
+            with open(part_path, 'rb') as f:
+                body = f.read()
+            expected = self._load_meta(meta_path).get('expected_length')
+            self.stats.inc_value('range_resume/resumed', spider=spider)
+        elif response.headers.get('Content-Length') and b'Content-Encoding' not in response.headers:
+            expected = int(response.headers['Content-Length'])
+
+        complete = (
+            'dataloss' not in response.flags
+            and (expected is None or len(body) == expected)
+            and image_is_complete(body, sniff_image_format(body))
+        )
+        if not complete:
+            self.stats.inc_value('range_resume/incomplete', spider=spider)
+            if not tracked:
+                self._discard(request)
+            return self._retry(request, spider, 'incomplete_image') or response
+
+        self._discard(request)
+        if response.status == 206:
+            headers = response.headers.copy()
+            headers.pop('Content-Range', None)
+            headers['Content-Length'] = str(len(body))
+            return response.replace(status=200, body=body, headers=headers)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        # Timeout ou conexão perdida: os bytes recebidos ficam para a próxima tentativa
+        if self._close(request):
+            self.stats.inc_value('range_resume/interrupted', spider=spider)
+        return None
+
+    def _retry(self, request, spider, reason):
+        return get_retry_request(request, spider=spider, reason=reason)
+
+
 class ImageScraperSpiderMiddleware:
     @classmethod
     def from_crawler(cls, crawler):
@@ -1,14 +1,34 @@
 import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
 from datetime import datetime
 import os
-from scrapy.exceptions import DropItem
-from scrapy.pipelines.images import ImagesPipeline
+import time
+from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.pipelines.files import FSFilesStore
+from scrapy.pipelines.images import ImageException, ImagesPipeline
 from scrapy.utils.python import to_bytes
 import scrapy
+from twisted.internet import defer, reactor
+from scraper.archive import ChapterArchive, archive_path, split_archive_path
 from scraper.items import ChapterItem
+from scraper.metrics import record_stage
+from scraper.media import (IMAGE_MIME_TYPES, TRANSCODE_FORMATS, BlobStore, image_is_complete,
+                           merkle_root, sniff_image_format, transcode_image)
+from scraper.state import PAGE_FILE_RE
 import logging
 import mimetypes
-from typing import List
+from typing import Dict, List
+from urllib.parse import urlparse
+
+def image_site_headers(base_url: str, referer=None, origin=None) -> Dict[str, str]:
+    """Referer/Origin das imagens: por padrão o site que as exibe; '' omite o header"""
+    site = urlparse(base_url)
+    site_origin = f"{site.scheme}://{site.netloc}"
+    referer = f"{site_origin}/" if referer is None else referer
+    origin = site_origin if origin is None else origin
+    return {name: value for name, value in (('Referer', referer), ('Origin', origin)) if value}
+
 
 class ImageValidationPipeline:
     def __init__(self, crawler):
@@ -28,37 +48,119 @@ class ImageDownloadPipeline(ImagesPipeline):
     def __init__(self, store_uri, download_func=None, settings=None):
         super().__init__(store_uri, download_func=download_func, settings=settings)
         self.logger = logging.getLogger(self.__class__.__name__)
+        # Grava os bytes originais em vez de decodificar e recodificar com o Pillow
+        self.passthrough = settings.getbool('IMAGES_PASSTHROUGH', True) if settings else True
+        self.image_priority = settings.getint('IMAGE_REQUEST_PRIORITY', 100) if settings else 0
+        # None: derivados da URL base do spider; '' não envia o header
+        self.image_referer = settings.get('IMAGE_REFERER') if settings else None
+        self.image_origin = settings.get('IMAGE_ORIGIN') if settings else None
+
+        # Saída em CBZ: as páginas vão direto para Serie/Capitulo_N.cbz
+        self.archives: Dict[tuple, ChapterArchive] = {}
+        self.cbz_output = bool(settings) and settings.get('IMAGES_OUTPUT', 'files') == 'cbz'
+        self.cbz_buffer = settings.getint('CBZ_BUFFER_BYTES', 32 * 1024 * 1024) if settings else 0
+        if self.cbz_output and not isinstance(self.store, FSFilesStore):
+            self.logger.warning("IMAGES_OUTPUT='cbz' requer IMAGES_STORE local; gravando arquivos soltos")
+            self.cbz_output = False
+        if self.cbz_output:
+            # O CBZ guarda os bytes originais de cada página
+            self.passthrough = True
+
+        # Deduplicação por conteúdo: só para o armazenamento local
+        self.blob_store = None
+        if self.passthrough and not self.cbz_output and settings and settings.getbool('IMAGES_DEDUP'):
+            if isinstance(self.store, FSFilesStore):
+                self.blob_store = BlobStore(self.store.basedir)
+            else:
+                self.logger.warning("IMAGES_DEDUP requer IMAGES_STORE local; deduplicação desativada")
 
     def _fingerprint(self, request):
         """Gera um fingerprint para o request"""
         return hashlib.sha1(to_bytes(request.url)).hexdigest()
 
+    def _clean_title(self, series_title: str) -> str:
+        return "".join(c if c.isalnum() or c in (' -_') else '_' for c in series_title)
+
+    def _image_headers(self, spider) -> Dict[str, str]:
+        """Headers das imagens, com Referer/Origin do site que as exibe"""
+        headers = {
+            'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+        }
+        base_url = getattr(spider, 'base_url', None) or 'https://hiper.cool/manga/'
+        headers.update(image_site_headers(base_url, self.image_referer, self.image_origin))
+        return headers
+
+    def _stored_pages(self, item, spider) -> Dict[int, str]:
+        """Páginas do capítulo já gravadas segundo o manifesto"""
+        state = getattr(spider, 'state', None)
+        if state is None:
+            return {}
+        return state.stored_pages(self._clean_title(item['series_title']), float(item['chapter']))
+
+    def process_item(self, item, spider):
+        started = time.monotonic()
+        dfd = super().process_item(item, spider)
+        dfd.addBoth(self._stage_done, started)
+        return dfd
+
+    def _stage_done(self, result, started):
+        record_stage(self.crawler, 'download', started)
+        return result
+
+    def queue_depths(self) -> Dict[str, int]:
+        return {'open_archives': len(self.archives)} if self.cbz_output else {}
+
+    def _archive_key(self, series_title: str, chapter) -> tuple:
+        return self._clean_title(series_title), float(chapter)
+
+    def _open_archive(self, item, stored_pages: Dict[int, str]):
+        """Abre o CBZ do capítulo, levando as páginas já gravadas no anterior"""
+        relative_path = archive_path(self._clean_title(item['series_title']), item['chapter'])
+        carried = {}
+        for page, path in stored_pages.items():
+            split = split_archive_path(path)
+            if split and split[0] == relative_path:
+                carried[page] = split[1]
+
+        key = self._archive_key(item['series_title'], item['chapter'])
+        if key in self.archives:
+            self.archives.pop(key).abort()
+        self.archives[key] = ChapterArchive(self.store.basedir, relative_path, carried, max_buffer=self.cbz_buffer)
+
     def get_media_requests(self, item, info) -> List[scrapy.Request]:
         requests = []
         if isinstance(item, ChapterItem):
-            for image in item['images']:
-                headers = {
-                    'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
-                    'Accept-Encoding': 'gzip, deflate, br',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Referer': 'https://hiper.cool/',
-                    'Origin': 'https://hiper.cool',
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-                }
+            # Pula páginas já gravadas de capítulos parcialmente baixados
+            stored_pages = self._stored_pages(item, info.spider)
+            headers = self._image_headers(info.spider)
+            for page, url in item['images']:
+                if page in stored_pages:
+                    continue
 
                 requests.append(scrapy.Request(
-                    url=image['url'],
+                    url=url,
                     headers=headers,
+                    # Imagens de um capítulo aberto passam à frente de páginas de capítulos novos
+                    priority=self.image_priority,
                     meta={
                         'series_title': item['series_title'],
                         'chapter_number': item['chapter'],
-                        'page': image['page'],
+                        'page': page,
                         'dont_redirect': False,
                         'handle_httpstatus_list': [301, 302],
-                        'original_url': image['url']
+                        'original_url': url,
+                        'range_resume': True,
+                        # Slots, pool de conexões e limite de taxa próprios dos hosts de imagens
+                        'host_class': 'image'
                     },
                     dont_filter=True
                 ))
+
+            if self.cbz_output and requests:
+                self._open_archive(item, stored_pages)
         return requests
 
     def file_path(self, request, response=None, info=None, *, item=None):
@@ -68,10 +170,13 @@ class ImageDownloadPipeline(ImagesPipeline):
             page_number = request.meta['page']
 
             # Limpa o nome da série
-            clean_series_title = "".join(c if c.isalnum() or c in (' -_') else '_' for c in series_title)
+            clean_series_title = self._clean_title(series_title)
 
             # Determina a extensão do arquivo
-            if response and response.headers.get('Content-Type'):
+            sniffed = sniff_image_format(response.body) if response is not None and self.passthrough else None
+            if sniffed:
+                ext = sniffed
+            elif response and response.headers.get('Content-Type'):
                 content_type = response.headers['Content-Type'].decode('utf-8')
                 ext = mimetypes.guess_extension(content_type) or '.jpg'
             else:
@@ -84,33 +189,299 @@ class ImageDownloadPipeline(ImagesPipeline):
             # Remove o ponto inicial da extensão se existir
             ext = ext.lstrip('.')
 
-            # Define o caminho do arquivo
-            filename = f"{clean_series_title}/Capitulo_{chapter_number}/pagina_{str(page_number).zfill(3)}.{ext}"
+            # Define o caminho do arquivo (no modo CBZ, a entrada dentro do arquivo do capítulo)
+            if self.cbz_output:
+                filename = f"{archive_path(clean_series_title, chapter_number)}/pagina_{str(page_number).zfill(3)}.{ext}"
+            else:
+                filename = f"{clean_series_title}/Capitulo_{chapter_number}/pagina_{str(page_number).zfill(3)}.{ext}"
 
             return filename
         except Exception as e:
             self.logger.error(f"Erro ao gerar caminho do arquivo: {e}")
             return f"error/image_{self._fingerprint(request)}.jpg"
 
+    def image_downloaded(self, response, request, info, *, item=None):
+        """Grava a página e retorna o SHA-256 dos bytes gravados
+
+        O hash é calculado sobre os bytes em memória no momento da gravação,
+        sem reler o arquivo do disco.
+        """
+        if not self.passthrough:
+            return self._image_converted(response, request, info, item=item)
+
+        # Checagem barata pelo cabeçalho do arquivo
+        image_format = sniff_image_format(response.body)
+        if image_format is None:
+            raise ImageException(f"Conteúdo não reconhecido como imagem ({response.headers.get('Content-Type')})")
+        # Uma imagem truncada não conta como página gravada
+        if not image_is_complete(response.body, image_format):
+            raise ImageException(f"Imagem incompleta ({len(response.body)} bytes)")
+
+        path = self.file_path(request, response=response, info=info, item=item)
+        checksum = hashlib.sha256(response.body).hexdigest()
+
+        if self.cbz_output:
+            archive = self.archives.get(self._archive_key(request.meta['series_title'], request.meta['chapter_number']))
+            if archive is None:
+                raise ImageException(f"CBZ do capítulo não está aberto: {path}")
+            archive.add(request.meta['page'], split_archive_path(path)[1], response.body)
+        elif self.blob_store is not None:
+            self._persist_deduplicated(path, response.body, image_format, checksum, info)
+        else:
+            buf = BytesIO(response.body)
+            self.store.persist_file(path, buf, info, headers={'Content-Type': IMAGE_MIME_TYPES[image_format]})
+        return checksum
+
+    def _image_converted(self, response, request, info, *, item=None):
+        """Caminho do ImagesPipeline (conversão pelo Pillow) com hash SHA-256"""
+        checksum = None
+        for path, image, buf in self.get_images(response, request, info, item=item):
+            if checksum is None:
+                checksum = hashlib.sha256(buf.getvalue()).hexdigest()
+            width, height = image.size
+            self.store.persist_file(
+                path,
+                buf,
+                info,
+                meta={'width': width, 'height': height},
+                headers={'Content-Type': 'image/jpeg'}
+            )
+        return checksum
+
+    def _persist_deduplicated(self, path, data, image_format, checksum, info):
+        """Grava o blob uma única vez e liga o caminho da página a ele"""
+        stats = info.spider.crawler.stats
+        _, blob_path, is_new = self.blob_store.put(data, image_format, digest=checksum)
+        self.blob_store.link(blob_path, path)
+
+        stats.inc_value('dedup/pages', spider=info.spider)
+        stats.inc_value('dedup/bytes_total', len(data), spider=info.spider)
+        if is_new:
+            stats.inc_value('dedup/bytes_stored', len(data), spider=info.spider)
+        else:
+            stats.inc_value('dedup/hits', spider=info.spider)
+            stats.inc_value('dedup/bytes_saved', len(data), spider=info.spider)
+
+    def close_spider(self, spider):
+        # CBZs de itens que não chegaram ao item_completed
+        for archive in self.archives.values():
+            archive.abort()
+        self.archives.clear()
+
+        if self.blob_store is None:
+            return
+
+        stats = spider.crawler.stats
+        bytes_total = stats.get_value('dedup/bytes_total', 0, spider=spider)
+        bytes_stored = stats.get_value('dedup/bytes_stored', 0, spider=spider)
+        if bytes_stored:
+            stats.set_value('dedup/ratio', round(bytes_total / bytes_stored, 3), spider=spider)
+        if not self.blob_store.link_supported:
+            self.logger.warning("Hardlinks não suportados em IMAGES_STORE: páginas repetidas foram copiadas")
+
     def item_completed(self, results, item, info):
         if isinstance(item, ChapterItem):
-            image_paths = [x['path'] for ok, x in results if ok]
+            stored_pages = self._stored_pages(item, info.spider)
+            new_pages = {}
+            new_hashes = {}
+            for ok, x in results:
+                if ok and (match := PAGE_FILE_RE.match(os.path.basename(x['path']))):
+                    page = int(match.group(1))
+                    new_pages[page] = x['path']
+                    # Arquivos 'uptodate' trazem o MD5 calculado pelo store; só o SHA-256 entra no manifesto
+                    if x.get('checksum') and len(x['checksum']) == 64:
+                        new_hashes[page] = x['checksum']
             failed_images = [x for ok, x in results if not ok]
 
             if failed_images:
                 self.logger.error(f"Falha ao baixar {len(failed_images)} imagens do capítulo {item['chapter']} de {item['series_title']}")
 
-            if not image_paths:
+            # Publica o CBZ antes de registrar as páginas no manifesto
+            archive = self.archives.pop(self._archive_key(item['series_title'], item['chapter']), None)
+            if archive is not None:
+                if not new_pages:
+                    archive.abort()
+                else:
+                    try:
+                        archive.finish()
+                    except (OSError, ValueError) as e:
+                        self.logger.error(f"Erro ao finalizar {archive.path}: {e}")
+                        archive.abort()
+                        new_pages, new_hashes = {}, {}
+
+            # Atualiza o manifesto com as páginas gravadas nesta execução
+            state = getattr(info.spider, 'state', None)
+            if state is not None and new_pages:
+                state.record_pages(
+                    self._clean_title(item['series_title']),
+                    float(item['chapter']),
+                    new_pages,
+                    expected_pages=item['image_count'],
+                    url=item['url'],
+                    hashes=new_hashes,
+                    series_url=item.get('series_url')
+                )
+
+            all_pages = {**stored_pages, **new_pages}
+
+            # Capítulo completo sai da fronteira; incompleto fica livre para outra tentativa
+            frontier = getattr(info.spider, 'frontier', None)
+            if frontier is not None and item.get('unit_url'):
+                if len(all_pages) >= item['image_count']:
+                    frontier.complete_chapter(item['unit_url'])
+                else:
+                    frontier.release_chapter(item['unit_url'])
+
+            if not all_pages:
                 raise DropItem(f"Nenhuma imagem baixada para o capítulo {item['chapter']} de {item['series_title']}")
 
-            item['path'] = image_paths
-            item['status'] = 'downloaded'
+            item['path'] = [all_pages[page] for page in sorted(all_pages)]
+            item['status'] = 'downloaded' if len(all_pages) >= item['image_count'] else 'partial'
             item['timestamp'] = datetime.now().isoformat()
 
-            self.logger.info(f"Baixadas {len(image_paths)} imagens para {item['series_title']} - Capítulo {item['chapter']}")
+            self.logger.info(f"Baixadas {len(new_pages)} imagens para {item['series_title']} - Capítulo {item['chapter']} ({len(all_pages)}/{item['image_count']} páginas)")
 
         return item
 
+class TranscodePipeline:
+    """Recodifica as páginas gravadas para TRANSCODE_FORMAT num pool de processos
+
+    O reactor nunca espera pelo Pillow: cada página vai para o pool e o item
+    só segue quando todas voltam. No máximo TRANSCODE_MAX_PENDING páginas
+    ficam em andamento; acima disso os itens aguardam vaga, o que segura o
+    scraper (SCRAPER_SLOT_MAX_ACTIVE_SIZE) e, por consequência, o crawl.
+    """
+
+    # GIFs podem ser animados e ficam como estão
+    SOURCE_FORMATS = ('jpg', 'jpeg', 'png', 'bmp')
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.logger = logging.getLogger(self.__class__.__name__)
+        settings = crawler.settings
+        self.image_format = settings.get('TRANSCODE_FORMAT', 'webp').lower()
+        if self.image_format not in TRANSCODE_FORMATS:
+            raise NotConfigured(f"TRANSCODE_FORMAT inválido: {self.image_format}")
+        self.quality = settings.getint('TRANSCODE_QUALITY', 80)
+        self.lossless = settings.getbool('TRANSCODE_LOSSLESS', False)
+        self.store_root = settings.get('IMAGES_STORE')
+        self.blob_store = BlobStore(self.store_root) if settings.getbool('IMAGES_DEDUP') else None
+        self.executor = ProcessPoolExecutor(max_workers=settings.getint('TRANSCODE_WORKERS') or None)
+        self.slots = defer.DeferredSemaphore(settings.getint('TRANSCODE_MAX_PENDING', 16))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('TRANSCODE_ENABLED'):
+            raise NotConfigured
+        if crawler.settings.get('IMAGES_OUTPUT', 'files') == 'cbz':
+            raise NotConfigured("TRANSCODE_ENABLED não se aplica a IMAGES_OUTPUT='cbz'")
+        return cls(crawler)
+
+    def queue_depths(self) -> Dict[str, int]:
+        # Páginas no pool mais as que aguardam vaga
+        in_flight = self.slots.limit - self.slots.tokens
+        return {'transcode_pending': in_flight + len(self.slots.waiting)}
+
+    def _submit(self, full_path: str) -> defer.Deferred:
+        """Envia uma página ao pool; o Deferred dispara no thread do reactor"""
+        d = defer.Deferred()
+        future = self.executor.submit(transcode_image, full_path, self.image_format, self.quality, self.lossless)
+
+        def done(future):
+            error = future.exception()
+            if error is not None:
+                reactor.callFromThread(d.errback, error)
+            else:
+                reactor.callFromThread(d.callback, future.result())
+
+        future.add_done_callback(done)
+        return d
+
+    @defer.inlineCallbacks
+    def process_item(self, item, spider):
+        if not isinstance(item, ChapterItem) or not item.get('path'):
+            return item
+
+        started = time.monotonic()
+        series = "".join(c if c.isalnum() or c in (' -_') else '_' for c in item['series_title'])
+        chapter = float(item['chapter'])
+        pending = [
+            (index, path) for index, path in enumerate(item['path'])
+            if os.path.splitext(path)[1].lstrip('.').lower() in self.SOURCE_FORMATS
+        ]
+
+        results = yield defer.DeferredList(
+            [self.slots.run(self._transcode_page, spider, series, chapter, path) for _, path in pending],
+            consumeErrors=True
+        )
+        for (index, _), (ok, new_path) in zip(pending, results):
+            if ok and new_path:
+                item['path'][index] = new_path
+        record_stage(self.crawler, 'transcode', started)
+        return item
+
+    @defer.inlineCallbacks
+    def _transcode_page(self, spider, series: str, chapter: float, path: str):
+        """Recodifica uma página e atualiza o manifesto; retorna o novo caminho"""
+        stats = self.crawler.stats
+        full_path = os.path.join(self.store_root, path)
+        try:
+            original_size = os.path.getsize(full_path)
+            data, cpu_time = yield self._submit(full_path)
+        except Exception as e:
+            self.logger.warning(f"Falha ao recodificar {path}: {e}")
+            stats.inc_value('transcode/errors', spider=spider)
+            return None
+
+        stats.inc_value('transcode/cpu_seconds', cpu_time, spider=spider)
+        if data is None:
+            stats.inc_value('transcode/skipped_larger', spider=spider)
+            return None
+
+        match = PAGE_FILE_RE.match(os.path.basename(path))
+        new_path = f"{os.path.splitext(path)[0]}.{self.image_format}"
+        checksum = hashlib.sha256(data).hexdigest()
+        state = getattr(spider, 'state', None)
+        old_hash = state.page_hashes(series, chapter).get(int(match.group(1))) if state and match else None
+
+        if self.blob_store is not None:
+            _, blob_path, _ = self.blob_store.put(data, self.image_format, digest=checksum)
+            self.blob_store.link(blob_path, new_path)
+        else:
+            tmp_path = os.path.join(self.store_root, f"{new_path}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.store_root, new_path))
+
+        if state is not None and match:
+            state.record_pages(series, chapter, {int(match.group(1)): new_path}, hashes={int(match.group(1)): checksum})
+        self._remove_original(full_path, path, old_hash)
+
+        stats.inc_value('transcode/pages', spider=spider)
+        stats.inc_value('transcode/bytes_before', original_size, spider=spider)
+        stats.inc_value('transcode/bytes_after', len(data), spider=spider)
+        stats.inc_value('transcode/bytes_saved', original_size - len(data), spider=spider)
+        return new_path
+
+    def _remove_original(self, full_path: str, path: str, old_hash):
+        """Apaga a página original e, com deduplicação, o blob que ficou sem uso"""
+        if os.path.isfile(full_path):
+            os.remove(full_path)
+        if self.blob_store is not None and old_hash:
+            ext = os.path.splitext(path)[1].lstrip('.')
+            blob_path = self.blob_store.blob_path(old_hash, ext)
+            # Só o próprio blob aponta para o conteúdo: nenhuma outra página o usa
+            if os.path.isfile(blob_path) and os.stat(blob_path).st_nlink == 1:
+                os.remove(blob_path)
+
+    def close_spider(self, spider):
+        self.executor.shutdown(wait=True)
+        stats = self.crawler.stats
+        cpu_seconds = stats.get_value('transcode/cpu_seconds')
+        if cpu_seconds is not None:
+            stats.set_value('transcode/cpu_seconds', round(cpu_seconds, 3), spider=spider)
+
+
 class ChecksumPipeline:
     def __init__(self, crawler):
         self.crawler = crawler
@@ -121,7 +492,17 @@ class ChecksumPipeline:
 
     def process_item(self, item, spider):
         if isinstance(item, ChapterItem) and item.get('path'):
-            # Calcula o checksum baseado nos caminhos das imagens
-            combined = ''.join(item['path']).encode('utf-8')
-            item['checksum'] = hashlib.md5(combined).hexdigest()
+            state = getattr(spider, 'state', None)
+            if state is None:
+                return item
+            started = time.monotonic()
+
+            # Digest Merkle do capítulo a partir do SHA-256 de cada página gravada
+            series = "".join(c if c.isalnum() or c in (' -_') else '_' for c in item['series_title'])
+            chapter = float(item['chapter'])
+            page_hashes = state.page_hashes(series, chapter)
+            if page_hashes and all(page_hashes.values()):
+                item['checksum'] = merkle_root(list(page_hashes.values()))
+                state.set_chapter_digest(series, chapter, item['checksum'])
+            record_stage(self.crawler, 'checksum', started)
         return item
@@ -9,13 +9,78 @@ USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTM
 DOWNLOADER_MIDDLEWARES = {
     'scrapy.downloadermiddlewares.retry.RetryMiddleware': 90,
     'scraper.middlewares.CustomRetryMiddleware': 100,
+    # Antes do limite de taxa: respostas do cache não esperam pelo token bucket
+    'scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware': 105,
+    'scraper.middlewares.AdaptiveRateLimitMiddleware': 110,
     'scrapy.downloadermiddlewares.httpproxy.HttpProxyMiddleware': 400,
+    'scraper.middlewares.RangeResumeMiddleware': 580,
 }
 
 # Ajustes de concorrência
 CONCURRENT_REQUESTS = 32
 CONCURRENT_REQUESTS_PER_DOMAIN = 16
 
+# Classes de host: o HTML do site e os hosts das imagens (em geral CDNs) têm
+# slots, pools de conexões keep-alive e limites de taxa separados, mesmo
+# quando são o mesmo host. CONCURRENT_REQUESTS vale só para o HTML; as
+# imagens são limitadas por IMAGE_HOST_CONCURRENCY em cada host.
+# <CLASSE>_HOST_HTTP2 multiplexa as requisições https da classe numa conexão
+# HTTP/2 por host (requer Twisted[http2]; não passa por proxy e não retoma
+# imagens interrompidas com Range)
+HTML_HOST_CONCURRENCY = 16
+HTML_HOST_POOL_SIZE = 16
+HTML_HOST_HTTP2 = False
+IMAGE_HOST_CONCURRENCY = 32
+IMAGE_HOST_POOL_SIZE = 32
+IMAGE_HOST_HTTP2 = False
+DOWNLOAD_HANDLERS = {
+    'http': 'scraper.downloader.HostClassDownloadHandler',
+    'https': 'scraper.downloader.HostClassDownloadHandler',
+}
+# Referer/Origin das imagens (None = raiz do site do spider; '' não envia)
+IMAGE_REFERER = None
+IMAGE_ORIGIN = None
+
+# Fan-out de capítulos: envia todos os capítulos pendentes de uma série ao
+# scheduler, limitando quantos ficam em voo por série
+CHAPTER_FANOUT_ENABLED = True
+CHAPTER_FANOUT_MAX_INFLIGHT = 8
+
+# Pool de séries: quantas séries ficam ativas ao mesmo tempo no modo download
+SERIES_WORKERS = 4
+
+# Conclusão primeiro: as imagens de capítulos já abertos passam à frente das
+# páginas de capítulos novos na fila de cada slot do downloader, e no máximo
+# MAX_OPEN_CHAPTERS capítulos ficam abertos ao mesmo tempo, da requisição da
+# página até o item sair dos pipelines (0 = sem limite)
+DOWNLOADER = 'scraper.downloader.PriorityDownloader'
+IMAGE_REQUEST_PRIORITY = 100
+MAX_OPEN_CHAPTERS = 16
+
+# Coleta: descobre a última página da listagem e solicita todas de uma vez
+COLLECT_PARALLEL_PAGINATION = True
+
+# Modo update: 'latest' percorre a listagem de lançamentos recentes até a
+# marca d'água da execução anterior; 'full' verifica todas as séries baixadas.
+# A varredura completa também roda a cada UPDATE_FULL_SWEEP_DAYS dias
+UPDATE_STRATEGY = 'latest'
+UPDATE_FULL_SWEEP_DAYS = 7
+UPDATE_LATEST_MAX_PAGES = 50
+UPDATE_WATERMARK_SIZE = 10
+
+# Limite de taxa adaptativo por host (token bucket + AIMD)
+RATELIMIT_ENABLED = True
+RATELIMIT_START_RATE = 50.0
+RATELIMIT_MIN_RATE = 0.5
+RATELIMIT_MAX_RATE = 50.0
+RATELIMIT_IMAGE_START_RATE = 200.0
+RATELIMIT_IMAGE_MAX_RATE = 200.0
+RATELIMIT_BURST = 16
+RATELIMIT_DECREASE_FACTOR = 0.5
+RATELIMIT_INCREASE_STEP = 1.0
+RATELIMIT_DEFAULT_RETRY_AFTER = 30.0
+RATELIMIT_MAX_RETRY_AFTER = 300.0
+
 # Delays e timeouts
 DOWNLOAD_DELAY = 0
 RANDOMIZE_DOWNLOAD_DELAY = False
@@ -30,8 +95,22 @@ RETRY_BACKOFF = True
 RETRY_BACKOFF_MAX = 60
 RETRY_PRIORITY_ADJUST = 2
 
-# Cache
-HTTPCACHE_ENABLED = False
+# Cache HTTP em disco (cache/httpcache) por tipo de página: capítulos para
+# sempre, páginas de série por HTTPCACHE_SERIES_TTL segundos, listagens e
+# imagens nunca. Acima de HTTPCACHE_MAX_BYTES sai o que foi usado há mais tempo
+HTTPCACHE_ENABLED = True
+HTTPCACHE_POLICY = 'scraper.httpcache.PageTypeCachePolicy'
+HTTPCACHE_STORAGE = 'scraper.httpcache.LRUFilesystemCacheStorage'
+HTTPCACHE_DIR = 'cache/httpcache'
+HTTPCACHE_SERIES_TTL = 3600
+HTTPCACHE_MAX_BYTES = 512 * 1024 * 1024
+HTTPCACHE_GZIP = True
+
+# Journal de erros (cache/report/errors.jsonl)
+ERROR_JOURNAL_FLUSH_INTERVAL = 5.0
+ERROR_JOURNAL_MAX_BUFFER = 100
+ERROR_JOURNAL_MAX_BYTES = 10485760
+ERROR_JOURNAL_BACKUP_COUNT = 5
 
 # Headers e Cookies
 COOKIES_ENABLED = True
@@ -64,11 +143,53 @@ MEDIA_ALLOW_REDIRECTS = True
 IMAGES_URLS_FIELD = 'image_urls'
 IMAGES_RESULT_FIELD = 'images'
 IMAGES_EXPIRES = 365
+# Grava as imagens com os bytes originais (sem recodificar com o Pillow)
+IMAGES_PASSTHROUGH = True
+# Armazena cada conteúdo uma única vez em downloads/.blobs (hardlinks no layout)
+IMAGES_DEDUP = True
+# Saída: 'files' (Serie/Capitulo_N/pagina_NNN.ext) ou 'cbz' (Serie/Capitulo_N.cbz,
+# gravado em fluxo na ordem das páginas; páginas adiantadas usam até
+# CBZ_BUFFER_BYTES de memória por capítulo e depois vão para arquivos temporários)
+IMAGES_OUTPUT = 'files'
+CBZ_BUFFER_BYTES = 32 * 1024 * 1024
+
+# Recodificação das páginas gravadas (ex.: WebP) num pool de processos.
+# TRANSCODE_QUALITY vale para o modo com perdas; TRANSCODE_LOSSLESS=True
+# gera WebP sem perdas. Páginas só são trocadas se o resultado for menor
+TRANSCODE_ENABLED = False
+TRANSCODE_FORMAT = 'webp'
+TRANSCODE_QUALITY = 80
+TRANSCODE_LOSSLESS = False
+TRANSCODE_WORKERS = 0  # 0 = um processo por núcleo
+TRANSCODE_MAX_PENDING = 16
+
+# Fronteira compartilhada entre nós (vazio = state.db local deste processo).
+# sqlite:///caminho/frontier.db serve para nós na mesma máquina (ou testes);
+# redis://host:6379/0 para várias máquinas (requer o pacote redis).
+# Aluguéis de séries e capítulos vencem após FRONTIER_LEASE_SECONDS sem
+# renovação e passam para qualquer outro nó. FRONTIER_NODE_ID padrão:
+# <host>:<diretório de cache>
+FRONTIER_URL = None
+FRONTIER_NODE_ID = None
+FRONTIER_LEASE_SECONDS = 300
+FRONTIER_PREFIX = 'scraper'
+
+# Métricas (Prometheus em http://127.0.0.1:METRICS_PORT/metrics; 0 desliga o endpoint)
+EXTENSIONS = {
+    'scraper.metrics.MetricsExtension': 500,
+    # Com JOBDIR o SpiderState do Scrapy trocaria spider.state (o CrawlState) por um dict
+    'scrapy.extensions.spiderstate.SpiderState': None,
+}
+METRICS_ENABLED = True
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9410
+METRICS_SAMPLE_INTERVAL = 5.0
 
 # Pipelines
 ITEM_PIPELINES = {
     'scraper.pipelines.ImageValidationPipeline': 100,
     'scraper.pipelines.ImageDownloadPipeline': 200,
+    'scraper.pipelines.TranscodePipeline': 250,
     'scraper.pipelines.ChecksumPipeline': 300,
 }
 
@@ -77,10 +198,16 @@ ROBOTSTXT_OBEY = False
 DOWNLOAD_MAXSIZE = 52428800
 DOWNLOAD_WARNSIZE = 20971520
 DOWNLOAD_FAIL_ON_DATALOSS = False
+# Imagens interrompidas ficam em RANGE_RESUME_DIR e são retomadas com Range;
+# só contam como gravadas quando completas (Content-Length e marcador de fim)
+RANGE_RESUME_ENABLED = True
+RANGE_RESUME_DIR = 'cache/partial'
 REDIRECT_MAX_TIMES = 10
 REDIRECT_ENABLED = True
 REACTOR_THREADPOOL_MAXSIZE = 50
-DNSCACHE_ENABLED = False
+# Cache de DNS do processo (sem TTL): evita resolver os hosts dos CDNs a cada conexão nova
+DNSCACHE_ENABLED = True
+DNSCACHE_SIZE = 10000
 AJAXCRAWL_ENABLED = True
 LOG_LEVEL = 'INFO'
 DUPEFILTER_CLASS = 'scrapy.dupefilters.RFPDupeFilter'
@@ -98,7 +225,8 @@ SCHEDULER_PRIORITY_QUEUE = 'scrapy.pqueues.DownloaderAwarePriorityQueue'
 SCHEDULER = 'scrapy.core.scheduler.Scheduler'
 SCHEDULER_DISK_QUEUE = 'scrapy.squeues.PickleFifoDiskQueue'
 SCHEDULER_MEMORY_QUEUE = 'scrapy.squeues.FifoMemoryQueue'
-DEPTH_PRIORITY = 1
+# Negativo: capítulos (mais profundos) antes de páginas de séries novas
+DEPTH_PRIORITY = -1
 
 # Configurações de compressão
 COMPRESSION_ENABLED = True
@@ -1,39 +1,72 @@
 import scrapy
+import hashlib
 import re
-from collections import deque
-from urllib.parse import urljoin
-from ..items import ChapterItem
+from urllib.parse import urljoin, urlparse
+from ..frontier import open_frontier
+from ..items import ChapterItem, ChapterPages
+from ..journal import ErrorJournal
+from ..metrics import COMPLETION_BUCKETS, Histogram, metrics_summary
+from ..state import CrawlState, COMPLETED, LEASED, PENDING
 import os
 import json
-from datetime import datetime
-from scrapy.http.response.text import TextResponse
+import time
+from datetime import datetime, timedelta
 from typing import Set
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
+from twisted.internet import task
+
+IMAGE_ID_RE = re.compile(r'^image-(\d+)$')
+# Atributos de lazy-load vêm antes do src, que costuma ser um placeholder
+IMAGE_SRC_ATTRS = ('data-src', 'data-lazy-src', 'data-original', 'src')
 
 class SeriesSpider(scrapy.Spider):
     name = 'series_spider'
+    default_base_url = 'https://hiper.cool/manga/'
 
-    def __init__(self, start_page=1, mode='collect', *args, **kwargs):
+    def __init__(self, start_page=1, mode='collect', update_strategy=None, base_url=None, cache_dir='cache',
+                 *args, **kwargs):
         super(SeriesSpider, self).__init__(*args, **kwargs)
-        self.base_url = 'https://hiper.cool/manga/'
+        # base_url permite apontar o spider para outro host (ex.: o site sintético dos benchmarks)
+        self.base_url = base_url or self.default_base_url
         self.current_page = int(start_page)
-        self.allowed_domains = ['hiper.cool']
+        self.allowed_domains = [urlparse(self.base_url).hostname]
         self.order_param = 'm_orderby=views'
+        self.latest_order_param = 'm_orderby=latest'
         self.mode = mode
+        self.update_strategy = update_strategy
 
-        # Diretórios de cache
-        self.cache_dir = 'cache'
+        # Diretórios de cache (cada shard do shard.py usa o seu)
+        self.cache_dir = cache_dir
         self.report_dir = os.path.join(self.cache_dir, 'report')
 
         # Cria diretórios necessários
         os.makedirs(self.cache_dir, exist_ok=True)
         os.makedirs(self.report_dir, exist_ok=True)
 
-        # Estruturas de cache
-        self.series_cache = self.load_cache('series_cache.json', {'series': [], 'last_update': None})
-        self.download_progress = self.load_cache('download_progress.json', {'completed': [], 'in_progress': None})
+        # Estado persistente (séries, aluguéis e conclusões) em SQLite
+        self.state = CrawlState(os.path.join(self.cache_dir, 'state.db'))
+        self.state.import_json(self.cache_dir)
+
+        # Tabela de capítulos e progresso de cada série em andamento (chave: URL da série)
+        self.series_units = {}
+
+        # Capítulos abertos (URL -> início) e séries esperando vaga em MAX_OPEN_CHAPTERS
+        # (URL da série -> próximo índice no modo serial, None no fan-out)
+        self.open_chapters = {}
+        self.parked_series = {}
+        self.chapter_latency = Histogram(COMPLETION_BUCKETS)
+        self.first_chapter_seconds = None
+
+        # Paginação paralela da coleta: páginas recebidas aguardando a mesclagem em ordem
+        self.listing_pages = {}
+        self.listing_next_page = self.current_page
+        self.listing_last_page = None
 
-        # Fila de séries
-        self.series_queue = deque()
+        # Atualização pela listagem de lançamentos recentes
+        self.latest_watermark = set()
+        self.new_watermark = []
+        self.latest_seen = set()
 
         # Métricas e monitoramento
         self.stats = {
@@ -41,37 +74,43 @@ class SeriesSpider(scrapy.Spider):
             'processed_series': 0,
             'downloaded_chapters': 0,
             'failed_downloads': 0,
+            'unchanged_series': 0,
             'total_bytes': 0
         }
 
-    def load_cache(self, filename: str, default: dict) -> dict:
-        """Carrega cache com tratamento de erro e backup"""
-        filepath = os.path.join(self.cache_dir, filename)
-        backup_filepath = f"{filepath}.backup"
-
-        try:
-            if os.path.exists(filepath):
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-        except json.JSONDecodeError:
-            self.logger.error(f"Erro ao carregar {filename}, tentando backup...")
-            if os.path.exists(backup_filepath):
-                with open(backup_filepath, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-
-        return default
-
-    def save_cache(self, data: dict, filename: str):
-        """Salva cache com backup"""
-        filepath = os.path.join(self.cache_dir, filename)
-        backup_filepath = f"{filepath}.backup"
-
-        # Cria backup do arquivo existente
-        if os.path.exists(filepath):
-            os.replace(filepath, backup_filepath)
-
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        settings = crawler.settings
+
+        # Journal de erros append-only com flush periódico
+        spider.error_journal = ErrorJournal(
+            os.path.join(spider.report_dir, 'errors.jsonl'),
+            flush_interval=settings.getfloat('ERROR_JOURNAL_FLUSH_INTERVAL', 5.0),
+            max_buffer=settings.getint('ERROR_JOURNAL_MAX_BUFFER', 100),
+            max_bytes=settings.getint('ERROR_JOURNAL_MAX_BYTES', 10 * 1024 * 1024),
+            backup_count=settings.getint('ERROR_JOURNAL_BACKUP_COUNT', 5)
+        )
+        spider.journal_flush = task.LoopingCall(spider.error_journal.flush)
+        spider.journal_flush.start(spider.error_journal.flush_interval, now=False)
+
+        # Manifesto de downloads: importa uma única vez o que já está em disco
+        spider.state.import_downloads(settings.get('IMAGES_STORE', 'downloads'))
+
+        # Fronteira de séries e capítulos: o state.db local ou um backend compartilhado entre nós
+        spider.frontier = open_frontier(settings, spider.state, spider.cache_dir)
+        spider.frontier_renew = task.LoopingCall(spider.frontier.renew)
+        if spider.frontier.shared:
+            spider.logger.info(f"Fronteira compartilhada em {settings.get('FRONTIER_URL')} (nó {spider.frontier.node_id})")
+            # Renova os aluguéis bem antes de vencerem
+            spider.frontier_renew.start(max(1, settings.getint('FRONTIER_LEASE_SECONDS', 300) / 3), now=False)
+            crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+
+        # O capítulo fecha quando o item sai dos pipelines (imagens gravadas ou descartado)
+        crawler.signals.connect(spider.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(spider.item_failed, signal=signals.item_dropped)
+        crawler.signals.connect(spider.item_failed, signal=signals.item_error)
+        return spider
 
     def start_requests(self):
         """Inicia o spider baseado no modo de operação"""
@@ -86,7 +125,7 @@ class SeriesSpider(scrapy.Spider):
                 callback=self.parse_series_list,
                 errback=self.handle_error,
                 dont_filter=True,
-                meta={'dont_cache': False}
+                meta={'dont_cache': False, 'page': self.current_page}
             )
 
         elif self.mode == 'download':
@@ -99,100 +138,320 @@ class SeriesSpider(scrapy.Spider):
 
     def parse_series_list(self, response):
         """Parse otimizado da lista de séries"""
-        self.logger.info(f"Analisando página {self.current_page} - URL: {response.url}")
+        page = response.meta.get('page', self.current_page)
+        self.logger.info(f"Analisando página {page} - URL: {response.url}")
 
-        series_links = set(
+        # Mantém a ordem da listagem, removendo duplicatas
+        series_links = list(dict.fromkeys(
             urljoin(self.base_url, link.strip())
             for link in response.css('div.page-listing-item a::attr(href)').getall()
             if '/manga/' in link and not any(x in link for x in ['/capitulo-', '/vol-'])
-        )
+        ))
 
-        self.logger.info(f"Página {self.current_page}: Encontradas {len(series_links)} séries")
+        self.logger.info(f"Página {page}: Encontradas {len(series_links)} séries")
 
-        new_series = series_links - set(self.series_cache['series'])
-        if new_series:
-            self.series_cache['series'].extend(new_series)
-            self.save_cache(self.series_cache, 'series_cache.json')
-            self.logger.info(f"Página {self.current_page}: Adicionadas {len(new_series)} novas séries ao cache")
-        else:
-            self.logger.info(f"Página {self.current_page}: Nenhuma série nova encontrada")
+        if response.meta.get('parallel'):
+            self.listing_pages[page] = series_links
+            self._merge_listing_pages()
+            return
+
+        last_page = None
+        if self.settings.getbool('COLLECT_PARALLEL_PAGINATION'):
+            last_page = self.find_last_page(response)
+
+        if last_page and last_page > page:
+            # Solicita todas as páginas restantes de uma vez
+            self.listing_last_page = last_page
+            self.listing_pages[page] = series_links
+            self._merge_listing_pages()
+
+            self.logger.info(f"Paginação paralela: solicitando páginas {page + 1} a {last_page}")
+            for next_page in range(page + 1, last_page + 1):
+                yield scrapy.Request(
+                    url=f"{self.base_url}page/{next_page}/?{self.order_param}",
+                    callback=self.parse_series_list,
+                    errback=self.handle_listing_error,
+                    meta={'page': next_page, 'parallel': True}
+                )
+            return
+
+        # Cadeia serial: segue o link da próxima página
+        self._add_series(page, series_links)
 
         next_page = response.css('a.nextpostslink::attr(href)').get()
         if next_page:
-            self.current_page += 1
+            self.current_page = page + 1
             next_url = f"{self.base_url}page/{self.current_page}/?{self.order_param}"
             self.logger.info(f"Movendo para próxima página: {next_url}")
             yield scrapy.Request(
                 url=next_url,
                 callback=self.parse_series_list,
-                errback=self.handle_error
+                errback=self.handle_error,
+                meta={'page': self.current_page}
             )
         else:
-            self.logger.info(f"Coleta concluída! Total de {len(self.series_cache['series'])} séries no cache")
+            self.logger.info(f"Coleta concluída! Total de {self.frontier.series_count()} séries no cache")
+
+    def find_last_page(self, response):
+        """Descobre o número da última página da listagem a partir da paginação"""
+        page_numbers = [
+            int(number)
+            for href in response.css('a::attr(href)').getall()
+            if '/manga/' in href
+            for number in re.findall(r'/page/(\d+)/?', href)
+        ]
+        return max(page_numbers) if page_numbers else None
+
+    def _add_series(self, page, series_links):
+        """Adiciona ao cache as séries novas de uma página, na ordem da listagem"""
+        new_series = self.frontier.add_series(series_links)
+        if new_series:
+            self.state.set_meta('last_update', datetime.now().isoformat())
+            self.logger.info(f"Página {page}: Adicionadas {len(new_series)} novas séries ao cache")
+        else:
+            self.logger.info(f"Página {page}: Nenhuma série nova encontrada")
+
+    def _merge_listing_pages(self):
+        """Mescla no cache as páginas já recebidas que formam um prefixo contínuo"""
+        while self.listing_next_page in self.listing_pages:
+            series_links = self.listing_pages.pop(self.listing_next_page)
+            if series_links is not None:
+                self._add_series(self.listing_next_page, series_links)
+            self.listing_next_page += 1
+
+        if self.listing_last_page and self.listing_next_page > self.listing_last_page:
+            self.logger.info(f"Coleta concluída! Total de {self.frontier.series_count()} séries no cache")
+
+    def handle_listing_error(self, failure):
+        """Registra a falha de uma página da listagem sem travar a mesclagem"""
+        self.handle_error(failure)
+        page = failure.request.meta['page']
+        self.logger.warning(f"Página {page} da listagem falhou e será ignorada nesta coleta")
+        self.listing_pages[page] = None
+        self._merge_listing_pages()
 
     def start_downloads(self):
         """Inicia o processo de download das séries"""
-        completed_series = set(self.download_progress['completed'])
-        pending_series = [s for s in self.series_cache['series'] if s not in completed_series]
+        self.frontier.reset_deferred()
+        leased_series = self.frontier.leased_series()
 
-        if not pending_series:
+        if not leased_series and not self.frontier.count_with_status(PENDING):
             self.logger.info("Não há novas séries para baixar")
             return
 
-        if self.download_progress['in_progress']:
-            current_series = self.download_progress['in_progress']
-            self.logger.info(f"Retomando downloads a partir de: {current_series}")
-        else:
-            current_series = pending_series[0]
-            self.download_progress['in_progress'] = current_series
-            self.save_cache(self.download_progress, 'download_progress.json')
+        # Séries alugadas numa execução anterior são retomadas primeiro
+        if leased_series:
+            self.logger.info(f"Retomando downloads de {len(leased_series)} séries: {leased_series}")
+        for series_url in leased_series:
+            yield self._series_request(series_url)
 
-        yield scrapy.Request(
-            url=current_series,
+        yield from self._fill_series_slots()
+
+    def spider_idle(self):
+        """Com fronteira compartilhada, espera os aluguéis de outros nós
+
+        Se um nó cair, os aluguéis dele vencem e este nó os assume; o spider
+        só fecha quando nenhum outro nó tem séries ou capítulos alugados.
+        """
+        if self.mode != 'download':
+            return
+
+        workers = max(1, self.settings.getint('SERIES_WORKERS', 4))
+        for series_url in self.frontier.lease_next(workers - self.frontier.count_with_status(LEASED)):
+            self.crawler.engine.crawl(self._series_request(series_url))
+        if self.frontier.count_with_status(LEASED) or self.frontier.leased_elsewhere():
+            raise DontCloseSpider
+
+    def _series_request(self, series_url):
+        """Cria a requisição da página de uma série alugada"""
+        return scrapy.Request(
+            url=series_url,
             callback=self.parse_series,
-            errback=self.handle_error,
-            meta={'series_index': pending_series.index(current_series)}
+            errback=self.handle_series_error,
+            meta={'series_url': series_url}
         )
 
+    def _fill_series_slots(self):
+        """Aluga séries pendentes até ocupar todos os slots do pool"""
+        workers = max(1, self.settings.getint('SERIES_WORKERS', 4))
+        leased_count = self.frontier.count_with_status(LEASED)
+
+        # O aluguel é gravado antes de a requisição ser enviada
+        new_series = self.frontier.lease_next(workers - leased_count)
+        if not new_series and not leased_count:
+            self.logger.info("Todas as séries foram processadas")
+
+        for series_url in new_series:
+            yield self._series_request(series_url)
+
     def start_updates(self):
         """Inicia o processo de verificação de atualizações"""
-        completed_series = self.download_progress['completed']
-        if not completed_series:
+        completed_count = self.frontier.count_with_status(COMPLETED)
+        if not completed_count:
             self.logger.info("Não há séries baixadas para verificar atualizações")
             return
 
-        self.logger.info(f"Verificando atualizações para {len(completed_series)} séries")
-
         # Cria um novo arquivo de log para as atualizações
         self.update_log = {
             'started': datetime.now().isoformat(),
             'updates': []
         }
 
-        # Verifica cada série completada
-        for series_url in completed_series:
-            yield scrapy.Request(
-                url=series_url,
-                callback=self.check_series_updates,
-                errback=self.handle_error,
-                meta={'update_mode': True},
-                dont_filter=True
-            )
+        if self._needs_full_sweep():
+            self.logger.info(f"Verificação completa: checando atualizações de {completed_count} séries")
+
+            # Verifica cada série completada
+            for series_url in self.frontier.completed_series():
+                yield self._update_request(series_url)
+            self.state.set_meta('last_full_sweep', datetime.now().isoformat())
+
+            # Registra a marca d'água para as próximas execuções incrementais
+            yield self._latest_request(1, watermark_only=True)
+        else:
+            self.latest_watermark = set(self.state.get_meta('latest_watermark', []))
+            self.logger.info("Verificando atualizações pela listagem de lançamentos recentes")
+            yield self._latest_request(1)
+
+    def _needs_full_sweep(self) -> bool:
+        """Decide entre a varredura completa e a listagem de lançamentos"""
+        strategy = self.update_strategy or self.settings.get('UPDATE_STRATEGY', 'latest')
+        if strategy == 'full':
+            return True
+
+        if not self.state.get_meta('latest_watermark'):
+            return True
+
+        # Varredura completa periódica como verificação de consistência
+        last_full_sweep = self.state.get_meta('last_full_sweep')
+        if not last_full_sweep:
+            return True
+        interval = timedelta(days=self.settings.getfloat('UPDATE_FULL_SWEEP_DAYS', 7))
+        return datetime.now() - datetime.fromisoformat(last_full_sweep) >= interval
+
+    def _latest_request(self, page, watermark_only=False):
+        """Requisição de uma página da listagem de lançamentos recentes"""
+        url = f"{self.base_url}?{self.latest_order_param}"
+        if page > 1:
+            url = f"{self.base_url}page/{page}/?{self.latest_order_param}"
+
+        return scrapy.Request(
+            url=url,
+            callback=self.parse_latest_listing,
+            errback=self.handle_error,
+            dont_filter=True,
+            meta={'page': page, 'watermark_only': watermark_only}
+        )
+
+    def parse_latest_listing(self, response):
+        """Percorre os lançamentos do mais novo ao mais antigo até a marca d'água"""
+        page = response.meta['page']
+        entries = self.extract_latest_entries(response)
+
+        if page == 1:
+            watermark_size = self.settings.getint('UPDATE_WATERMARK_SIZE', 10)
+            self.new_watermark = [key for _, key in entries[:watermark_size]]
+
+        if response.meta['watermark_only']:
+            self.state.set_meta('latest_watermark', self.new_watermark)
+            return
+
+        reached_watermark = False
+        for series_url, key in entries:
+            if key in self.latest_watermark:
+                reached_watermark = True
+                break
+
+            if series_url in self.latest_seen:
+                continue
+            self.latest_seen.add(series_url)
+
+            # Só verifica séries que já foram baixadas
+            if self.frontier.is_completed(series_url):
+                yield self._update_request(series_url)
+
+        max_pages = self.settings.getint('UPDATE_LATEST_MAX_PAGES', 50)
+        has_next = response.css('a.nextpostslink::attr(href)').get()
+
+        if not reached_watermark and has_next and page < max_pages:
+            yield self._latest_request(page + 1)
+            return
+
+        if not reached_watermark and has_next:
+            # A marca d'água ficou além do limite: força a varredura completa na próxima execução
+            self.logger.warning(f"Marca d'água não encontrada em {max_pages} páginas de lançamentos")
+            self.state.set_meta('last_full_sweep', None)
+
+        self.state.set_meta('latest_watermark', self.new_watermark)
+        self.logger.info(f"Lançamentos recentes: {len(self.latest_seen)} séries atualizadas em {page} páginas")
+
+    def extract_latest_entries(self, response) -> list:
+        """Extrai (URL da série, chave do lançamento) de cada item da listagem"""
+        items = response.css('div.page-listing-item div.page-item-detail') or response.css('div.page-listing-item')
+
+        entries = []
+        for item in items:
+            series_url = chapter_url = None
+            for link in item.css('a::attr(href)').getall():
+                link = urljoin(self.base_url, link.strip())
+                if '/capitulo-' in link or '/vol-' in link:
+                    chapter_url = chapter_url or link
+                elif '/manga/' in link:
+                    series_url = series_url or link
+            if series_url:
+                # O último capítulo identifica o lançamento; a série sozinha repete a cada capítulo
+                entries.append((series_url, f"{series_url}|{chapter_url or ''}"))
+        return entries
+
+    def _update_request(self, series_url):
+        """Requisição condicional da página da série (ETag / Last-Modified)"""
+        headers = {}
+        validators = self.state.series_validators(series_url)
+        if validators:
+            if validators['etag']:
+                headers['If-None-Match'] = validators['etag']
+            if validators['last_modified']:
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        return scrapy.Request(
+            url=series_url,
+            headers=headers,
+            callback=self.check_series_updates,
+            errback=self.handle_error,
+            # O modo update precisa da versão atual da página, nunca da cópia do cache HTTP
+            meta={'update_mode': True, 'series_url': series_url, 'handle_httpstatus_list': [304], 'dont_cache': True},
+            dont_filter=True
+        )
 
     def check_series_updates(self, response):
         """Verifica se há novos capítulos para uma série"""
-        series_title = response.css('h1::text').get('').strip()
-
-        # Obtém o caminho da série
-        clean_name = self.clean_title(series_title)
-        series_path = os.path.join('downloads', clean_name)
+        series_url = response.meta.get('series_url', response.url)
+        if response.status == 304:
+            self.stats['unchanged_series'] += 1
+            self.logger.debug(f"Série sem alterações (304): {series_url}")
+            return
 
         # Processa capítulos disponíveis
         chapter_links = response.css('a[href*="/capitulo-"]::attr(href), a[href*="/vol-"]::attr(href)').getall()
-        chapter_links = list(set(chapter_links))
+        chapter_links = sorted(set(link.strip() for link in chapter_links))
+
+        # Lista de capítulos idêntica à da última verificação sincronizada
+        chapter_hash = hashlib.sha1('\n'.join(chapter_links).encode('utf-8')).hexdigest()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        etag = etag.decode('latin-1') if etag else None
+        last_modified = last_modified.decode('latin-1') if last_modified else None
+
+        validators = self.state.series_validators(series_url)
+        if validators and validators['chapter_hash'] == chapter_hash:
+            self.stats['unchanged_series'] += 1
+            self.state.set_series_validators(series_url, etag, last_modified, chapter_hash)
+            self.logger.debug(f"Lista de capítulos inalterada: {series_url}")
+            return
+
+        series_title = response.css('h1::text').get('').strip()
 
         # Mapeia capítulos já baixados
-        downloaded_chapters = self.get_downloaded_chapters(series_path)
+        downloaded_chapters = self.get_downloaded_chapters(series_title)
 
         # Filtra e identifica novos capítulos
         new_chapters = []
@@ -220,18 +479,18 @@ class SeriesSpider(scrapy.Spider):
                 json.dump(self.update_log, f, indent=2)
 
             # Inicia o download dos novos capítulos
-            yield from self._crawl_next_unit(series_title, new_chapters, 0, response.url)
+            yield from self._start_units(series_title, new_chapters, series_url)
         else:
+            # Só guarda os validadores quando tudo já está baixado; com capítulos
+            # novos a série é verificada por completo na próxima execução
+            self.state.set_series_validators(series_url, etag, last_modified, chapter_hash)
             self.logger.info(f"[{series_title}] Nenhum novo capítulo encontrado")
 
     def parse_series(self, response):
         """Parse da página da série para coletar capítulos"""
+        series_url = response.meta.get('series_url', response.url)
         series_title = response.css('h1::text').get('').strip()
 
-        # Preparação do diretório
-        clean_name = self.clean_title(series_title)
-        series_path = os.path.join('downloads', clean_name)
-
         # Coleta todos os links de capítulos
         chapter_links = response.css('a[href*="/capitulo-"]::attr(href), a[href*="/vol-"]::attr(href)').getall()
         chapter_links = list(set(chapter_links))
@@ -247,7 +506,7 @@ class SeriesSpider(scrapy.Spider):
 
         if numeric_links:
             # Verifica capítulos já baixados
-            downloaded_chapters = self.get_downloaded_chapters(series_path)
+            downloaded_chapters = self.get_downloaded_chapters(series_title)
 
             # Filtra capítulos pendentes
             pending_chapters = []
@@ -257,48 +516,193 @@ class SeriesSpider(scrapy.Spider):
                     pending_chapters.append(link)
 
             if pending_chapters:
-                yield from self._crawl_next_unit(series_title, pending_chapters, 0, response.url)
+                yield from self._start_units(series_title, pending_chapters, series_url)
             else:
                 # Série completa
-                self.download_progress['completed'].append(response.url)
-                self.download_progress['in_progress'] = None
-                self.save_cache(self.download_progress, 'download_progress.json')
-                self.stats['processed_series'] += 1
+                yield from self._finish_series(series_url)
+        else:
+            # Sem capítulos: libera o slot sem marcar a série como concluída
+            self.logger.warning(f"[{series_title}] Nenhum capítulo encontrado em {series_url}")
+            self.frontier.release(series_url)
+            yield from self._fill_series_slots()
+
+    def _start_units(self, series_title, unit_links, original_url):
+        """Inicia o download dos capítulos pendentes (serial ou fan-out)
+
+        A tabela de capítulos fica uma única vez em series_units; as
+        requisições levam só a URL da série e o índice do capítulo, em vez
+        de repetir a lista inteira no meta (e no pickle da fila em disco).
+        """
+        self.series_units[original_url] = {
+            'series_title': series_title,
+            'links': tuple(unit_links),
+            'next': 0,
+            'inflight': 0
+        }
+        if self.settings.getbool('CHAPTER_FANOUT_ENABLED'):
+            yield from self._dispatch_units(original_url)
+        else:
+            yield from self._crawl_next_unit(original_url, 0)
 
-                # Próxima série
-                yield from self.process_next_series(response)
+    def _dispatch_units(self, original_url):
+        """Envia capítulos ao scheduler até o limite de requisições em voo da série"""
+        state = self.series_units.get(original_url)
+        if state is None:
+            return
 
-    def _crawl_next_unit(self, series_title, unit_links, index, original_url):
+        max_inflight = max(1, self.settings.getint('CHAPTER_FANOUT_MAX_INFLIGHT', 8))
+        links = state['links']
+        while state['next'] < len(links) and state['inflight'] < max_inflight:
+            if not self._chapter_slot_free():
+                self._park_series(original_url, None)
+                break
+            index = state['next']
+            state['next'] += 1
+            unit_url = urljoin(self.base_url, links[index])
+            if not self._lease_unit(unit_url, state['series_title'], original_url):
+                continue
+            state['inflight'] += 1
+            self.open_chapters[unit_url] = time.monotonic()
+            yield scrapy.Request(
+                url=unit_url,
+                callback=self.parse_chapter_or_volume,
+                errback=self.handle_unit_error,
+                # Sem dont_filter um capítulo descartado pelo dupefilter nunca
+                # liberaria seu slot e a série jamais seria concluída
+                dont_filter=True,
+                meta={
+                    'series_title': state['series_title'],
+                    'index': index,
+                    'original_url': original_url,
+                    'update_mode': self.mode == 'update',
+                    'unit_url': unit_url,
+                    'fanout': True
+                }
+            )
+
+        if state['next'] >= len(links) and state['inflight'] == 0:
+            # Último capítulo finalizado: conclui a série uma única vez
+            del self.series_units[original_url]
+            yield from self._finish_series(original_url)
+
+    def _unit_done(self, meta):
+        """Avança a série após um capítulo terminar (com sucesso ou erro)"""
+        original_url = meta['original_url']
+        if meta.get('fanout'):
+            state = self.series_units.get(original_url)
+            if state is not None:
+                state['inflight'] -= 1
+            yield from self._dispatch_units(original_url)
+        else:
+            yield from self._crawl_next_unit(original_url, meta['index'] + 1)
+
+        # Vagas liberadas por capítulos que terminaram sem item vão para as séries em espera
+        yield from self._resume_parked()
+
+    def _crawl_next_unit(self, original_url, index):
         """Processa próximo capítulo/volume"""
-        if index < len(unit_links):
-            next_unit_url = urljoin(self.base_url, unit_links[index])
+        state = self.series_units.get(original_url)
+        if state is None:
+            return
+
+        series_title, links = state['series_title'], state['links']
+        if index < len(links) and not self._chapter_slot_free():
+            self._park_series(original_url, index)
+            return
+
+        while index < len(links):
+            if self._lease_unit(urljoin(self.base_url, links[index]), series_title, original_url):
+                break
+            index += 1
+
+        if index < len(links):
+            next_unit_url = urljoin(self.base_url, links[index])
+            self.open_chapters[next_unit_url] = time.monotonic()
             yield scrapy.Request(
                 url=next_unit_url,
                 callback=self.parse_chapter_or_volume,
-                errback=self.handle_error,
+                errback=self.handle_unit_error,
+                # Um capítulo descartado pelo dupefilter nunca fecharia a sua vaga
+                dont_filter=True,
                 meta={
                     'series_title': series_title,
-                    'unit_links': unit_links,
                     'index': index,
                     'original_url': original_url,
-                    'update_mode': self.mode == 'update'
+                    'update_mode': self.mode == 'update',
+                    'unit_url': next_unit_url
                 }
             )
         else:
-            if self.mode != 'update':
-                self.download_progress['completed'].append(original_url)
-                self.download_progress['in_progress'] = None
-                self.save_cache(self.download_progress, 'download_progress.json')
+            del self.series_units[original_url]
+            yield from self._finish_series(original_url)
+
+    def _chapter_slot_free(self):
+        """Há vaga para abrir mais um capítulo (MAX_OPEN_CHAPTERS; 0 = sem limite)"""
+        limit = self.settings.getint('MAX_OPEN_CHAPTERS', 16)
+        return limit <= 0 or len(self.open_chapters) < limit
+
+    def _park_series(self, original_url, index):
+        """Deixa a série esperando uma vaga de capítulo, na ordem de chegada"""
+        self.parked_series.setdefault(original_url, index)
+
+    def _resume_parked(self):
+        """Retoma as séries em espera enquanto houver vaga"""
+        while self.parked_series and self._chapter_slot_free():
+            original_url = next(iter(self.parked_series))
+            index = self.parked_series.pop(original_url)
+            if index is None:
+                yield from self._dispatch_units(original_url)
+            else:
+                yield from self._crawl_next_unit(original_url, index)
+
+    def _close_chapter(self, unit_url, completed=False):
+        """Libera a vaga do capítulo e registra o tempo até a conclusão"""
+        started = self.open_chapters.pop(unit_url, None)
+        if started is None or not completed:
+            return
+        self.chapter_latency.observe(time.monotonic() - started)
+        if self.first_chapter_seconds is None:
+            self.first_chapter_seconds = round((datetime.now() - self.stats['start_time']).total_seconds(), 3)
+
+    def item_scraped(self, item, spider):
+        if isinstance(item, ChapterItem):
+            # Capítulo com páginas faltando não conta como concluído
+            self._chapter_finished(item['unit_url'], completed=item.get('status') != 'partial')
+
+    def item_failed(self, item, spider):
+        if isinstance(item, ChapterItem):
+            self._chapter_finished(item['unit_url'])
+
+    def _chapter_finished(self, unit_url, completed=False):
+        self._close_chapter(unit_url, completed)
+        for request in self._resume_parked():
+            self.crawler.engine.crawl(request)
+
+    def queue_depths(self):
+        return {'open_chapters': len(self.open_chapters), 'parked_series': len(self.parked_series)}
+
+    def _lease_unit(self, unit_url, series_title, original_url):
+        """Aluga o capítulo na fronteira; False se outro nó já cuida dele"""
+        if self.frontier.lease_chapter(unit_url, original_url):
+            return True
+        self.logger.debug(f"[{series_title}] {unit_url} já foi baixado ou está alugado por outro nó")
+        self.crawler.stats.inc_value('frontier/chapters_skipped', spider=self)
+        return False
+
+    def _finish_series(self, original_url):
+        """Registra a série como concluída e libera o slot para a próxima"""
+        if self.mode == 'update':
+            return
+
+        self.frontier.complete(original_url)
+        self.stats['processed_series'] += 1
 
-            response = TextResponse(url=original_url)
-            yield from self.process_next_series(response)
+        yield from self._fill_series_slots()
 
     def parse_chapter_or_volume(self, response):
         """Parse do capítulo/volume para coletar imagens"""
         series_title = response.meta['series_title']
-        unit_links = response.meta['unit_links']
         index = response.meta['index']
-        original_url = response.meta['original_url']
 
         match = re.search(r'(?:capitulo|vol)-(\d+(?:\.\d+)?)', response.url, re.IGNORECASE)
         unit_number = match.group(1) if match else str(index + 1)
@@ -313,82 +717,62 @@ class SeriesSpider(scrapy.Spider):
                 url=response.url,
                 image_count=len(images),
                 images=images,
-                series_title=series_title
+                series_title=series_title,
+                series_url=response.meta['original_url'],
+                unit_url=response.meta['unit_url']
             )
-
-            # Próximo capítulo
-            yield from self._crawl_next_unit(series_title, unit_links, index + 1, original_url)
         else:
             self.logger.warning(f"[{series_title}] Unidade {unit_number}: nenhuma imagem encontrada")
-            # Tenta próximo capítulo mesmo sem imagens
-            yield from self._crawl_next_unit(series_title, unit_links, index + 1, original_url)
-
-    def extract_images(self, response) -> list:
-        """Extração otimizada de imagens"""
-        images = []
-        page_number = 1
-
-        for i in range(1, 300):
-            padded_num = str(i).zfill(2)
-            sel_full = response.css(f'#image-{padded_num}')
-            sel_short = response.css(f'#image-{i}')
-
-            if not sel_full and not sel_short:
-                break
-
-            sel = sel_full if sel_full else sel_short
-            img_url = sel.xpath('@src').get()
-
+            self.frontier.release_chapter(response.meta['unit_url'])
+            self._close_chapter(response.meta['unit_url'])
+
+        # Próximo capítulo (mesmo sem imagens)
+        yield from self._unit_done(response.meta)
+
+    def extract_images(self, response) -> ChapterPages:
+        """Extração de imagens em uma única passada pelo documento"""
+        pages = {}
+        for sel in response.xpath('//*[starts-with(@id, "image-")]'):
+            match = IMAGE_ID_RE.match(sel.attrib.get('id', ''))
+            if not match:
+                continue
+
+            # 'image-01' e 'image-1' são a mesma página; o id com zero à esquerda tem prioridade
+            index = int(match.group(1))
+            padded = match.group(1).startswith('0')
+            if index in pages and (pages[index][0] or not padded):
+                continue
+
+            img_url = self._image_source(sel)
             if img_url:
-                images.append({
-                    'url': urljoin(response.url, img_url.strip()),
-                    'page': page_number
-                })
-                page_number += 1
-
-        return images
-
-    def process_next_series(self, response):
-        """Processa próxima série pendente"""
-        if self.mode == 'update':
-            return
-
-        current_url = response.url
-        try:
-            current_index = self.series_cache['series'].index(current_url)
-            next_index = current_index + 1
-
-            if next_index < len(self.series_cache['series']):
-                next_series = self.series_cache['series'][next_index]
-                if next_series not in self.download_progress['completed']:
-                    self.download_progress['in_progress'] = next_series
-                    self.save_cache(self.download_progress, 'download_progress.json')
-
-                    yield scrapy.Request(
-                        url=next_series,
-                        callback=self.parse_series,
-                        errback=self.handle_error,
-                        meta={'series_index': next_index}
-                    )
-                else:
-                    response = TextResponse(url=next_series)
-                    yield from self.process_next_series(response)
-            else:
-                self.logger.info("Todas as séries foram processadas")
-        except ValueError:
-            self.logger.error(f"Série não encontrada no cache: {current_url}")
-
-    def get_downloaded_chapters(self, series_path: str) -> Set[float]:
-        """Retorna conjunto de capítulos já baixados"""
-        downloaded = set()
-        if os.path.exists(series_path):
-            for item in os.listdir(series_path):
-                if match := re.search(r'Capitulo_(\d+(?:\.\d+)?)', item):
-                    try:
-                        downloaded.add(float(match.group(1)))
-                    except ValueError:
-                        self.logger.warning(f"Número de capítulo inválido: {item}")
-        return downloaded
+                pages[index] = (padded, img_url)
+
+        # Ordena pelo sufixo numérico e renumera as páginas, ignorando lacunas
+        return ChapterPages(urljoin(response.url, pages[index][1]) for index in sorted(pages))
+
+    def _image_source(self, sel):
+        """Retorna a URL da imagem, preferindo atributos de lazy-load ao src"""
+        attrs = sel.attrib
+        if sel.root.tag != 'img' and not any(a in attrs for a in IMAGE_SRC_ATTRS):
+            # O id pode estar num contêiner em volta da <img>
+            inner = sel.css('img')
+            if not inner:
+                return None
+            attrs = inner[0].attrib
+
+        for attr in IMAGE_SRC_ATTRS:
+            value = attrs.get(attr, '').strip()
+            if value and not value.startswith('data:'):
+                return value
+        return None
+
+    def get_downloaded_chapters(self, series_title: str) -> Set[float]:
+        """Retorna conjunto de capítulos completos segundo o manifesto
+
+        Capítulos com páginas faltando ficam de fora e são baixados de novo;
+        o pipeline pula as páginas que já estão gravadas.
+        """
+        return self.state.completed_chapters(self.clean_title(series_title))
 
     def handle_error(self, failure):
         """Tratamento de erros de requisição"""
@@ -398,23 +782,29 @@ class SeriesSpider(scrapy.Spider):
         error_data = {
             'url': request.url,
             'error': str(failure.value),
+            'error_type': failure.type.__name__,
             'timestamp': datetime.now().isoformat()
         }
+        response = getattr(failure.value, 'response', None)
+        if response is not None:
+            error_data['status'] = response.status
 
-        error_log_file = os.path.join(self.report_dir, 'error_log.json')
-        try:
-            if os.path.exists(error_log_file):
-                with open(error_log_file, 'r', encoding='utf-8') as f:
-                    errors = json.load(f)
-            else:
-                errors = []
+        self.error_journal.append(error_data)
+
+    def handle_series_error(self, failure):
+        """Registra a falha da página da série e libera seu slot"""
+        self.handle_error(failure)
 
-            errors.append(error_data)
+        # A série continua pendente e será tentada novamente na próxima execução
+        self.frontier.release(failure.request.meta['series_url'])
+        yield from self._fill_series_slots()
 
-            with open(error_log_file, 'w', encoding='utf-8') as f:
-                json.dump(errors, f, indent=2)
-        except Exception as e:
-            self.logger.error(f"Erro ao salvar log de erro: {str(e)}")
+    def handle_unit_error(self, failure):
+        """Registra a falha de um capítulo e libera o avanço da série"""
+        self.handle_error(failure)
+        self.frontier.release_chapter(failure.request.meta['unit_url'])
+        self._close_chapter(failure.request.meta['unit_url'])
+        yield from self._unit_done(failure.request.meta)
 
     def clean_title(self, title: str) -> str:
         """Limpa o título da série para uso em nome de arquivo/diretório"""
@@ -422,10 +812,8 @@ class SeriesSpider(scrapy.Spider):
 
     def closed(self, reason):
         """Finalização com relatório detalhado"""
-        self.save_cache(self.series_cache, 'series_cache.json')
-        self.save_cache(self.download_progress, 'download_progress.json')
-
         duration = datetime.now() - self.stats['start_time']
+        self.stats['total_bytes'] = self.crawler.stats.get_value('downloader/response_bytes', 0)
 
         report = {
             'mode': self.mode,
@@ -433,8 +821,19 @@ class SeriesSpider(scrapy.Spider):
             'processed_series': self.stats['processed_series'],
             'downloaded_chapters': self.stats['downloaded_chapters'],
             'failed_downloads': self.stats['failed_downloads'],
+            'unchanged_series': self.stats['unchanged_series'],
+            'dedup_ratio': self.crawler.stats.get_value('dedup/ratio'),
+            'dedup_bytes_saved': self.crawler.stats.get_value('dedup/bytes_saved', 0),
+            'httpcache_hits': self.crawler.stats.get_value('httpcache/hit', 0),
+            'httpcache_misses': self.crawler.stats.get_value('httpcache/miss', 0),
+            'transcode_pages': self.crawler.stats.get_value('transcode/pages', 0),
+            'transcode_cpu_seconds': self.crawler.stats.get_value('transcode/cpu_seconds', 0),
+            'transcode_bytes_saved': self.crawler.stats.get_value('transcode/bytes_saved', 0),
+            'chapter_completion_seconds': self.chapter_latency.summary(),
+            'first_chapter_seconds': self.first_chapter_seconds,
             'total_bytes': self.stats['total_bytes'],
             'average_speed': f"{self.stats['total_bytes']/duration.total_seconds()/1024:.2f} KB/s" if duration.total_seconds() > 0 else "N/A",
+            'metrics': metrics_summary(self.crawler),
             'finish_reason': reason,
             'timestamp': datetime.now().isoformat()
         }
@@ -448,3 +847,11 @@ class SeriesSpider(scrapy.Spider):
             json.dump(report, f, indent=2)
 
         self.logger.info(f"Spider finalizado: {report}")
+        if self.frontier_renew.running:
+            self.frontier_renew.stop()
+        self.frontier.close()
+        self.state.close()
+
+        if self.journal_flush.running:
+            self.journal_flush.stop()
+        self.error_journal.close()
@@ -0,0 +1,407 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    url TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_series_status ON series (status, position);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    series TEXT NOT NULL,
+    chapter REAL NOT NULL,
+    expected_pages INTEGER,
+    stored_pages INTEGER NOT NULL DEFAULT 0,
+    url TEXT,
+    series_url TEXT,
+    digest TEXT,
+    updated_at TEXT,
+    PRIMARY KEY (series, chapter)
+);
+CREATE TABLE IF NOT EXISTS pages (
+    series TEXT NOT NULL,
+    chapter REAL NOT NULL,
+    page INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    sha256 TEXT,
+    PRIMARY KEY (series, chapter, page)
+);
+CREATE TABLE IF NOT EXISTS series_http (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    chapter_hash TEXT,
+    checked_at TEXT
+);
+"""
+
+# Colunas adicionadas depois da criação das tabelas (bancos antigos)
+MIGRATIONS = {
+    'chapters': [('series_url', 'TEXT'), ('digest', 'TEXT')],
+    'pages': [('sha256', 'TEXT')],
+}
+
+PAGE_FILE_RE = re.compile(r'^pagina_(\d+)\.\w+$')
+CHAPTER_DIR_RE = re.compile(r'^Capitulo_(\d+(?:\.\d+)?)$')
+CHAPTER_ARCHIVE_RE = re.compile(r'^Capitulo_(\d+(?:\.\d+)?)\.cbz$')
+
+# Estados possíveis de uma série
+PENDING = 'pending'
+LEASED = 'leased'
+COMPLETED = 'completed'
+# Liberada após falha: volta a 'pending' só na próxima execução
+DEFERRED = 'deferred'
+
+
+class CrawlState:
+    """Estado da coleta e dos downloads em SQLite (modo WAL)
+
+    Substitui series_cache.json / download_progress.json: cada mudança é
+    uma atualização indexada em vez de reescrever o arquivo inteiro.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        for table, columns in MIGRATIONS.items():
+            existing = {row[1] for row in self.conn.execute(f'PRAGMA table_info({table})')}
+            for column, column_type in columns:
+                if column not in existing:
+                    self.conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+
+    @contextmanager
+    def transaction(self):
+        """Agrupa várias escritas numa única transação"""
+        if self.conn.in_transaction:
+            yield self.conn
+            return
+
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        self.conn.execute('COMMIT')
+
+    def close(self):
+        self.conn.close()
+
+    # Metadados
+
+    def get_meta(self, key: str, default=None):
+        row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key: str, value):
+        self.conn.execute(
+            'INSERT INTO meta (key, value) VALUES (?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+            (key, json.dumps(value))
+        )
+
+    # Séries
+
+    def add_series(self, urls: Iterable[str]) -> List[str]:
+        """Adiciona séries no fim da listagem e retorna as que eram novas"""
+        added = []
+        with self.transaction() as conn:
+            position = conn.execute('SELECT COALESCE(MAX(position), 0) FROM series').fetchone()[0]
+            for url in urls:
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO series (url, position, status) VALUES (?, ?, ?)',
+                    (url, position + 1, PENDING)
+                )
+                if cursor.rowcount:
+                    position += 1
+                    added.append(url)
+        return added
+
+    def series_count(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM series').fetchone()[0]
+
+    def all_series(self) -> List[str]:
+        return [row[0] for row in self.conn.execute('SELECT url FROM series ORDER BY position')]
+
+    def series_status(self, url: str) -> Optional[str]:
+        row = self.conn.execute('SELECT status FROM series WHERE url = ?', (url,)).fetchone()
+        return row[0] if row else None
+
+    def is_completed(self, url: str) -> bool:
+        return self.series_status(url) == COMPLETED
+
+    def series_with_status(self, status: str) -> List[str]:
+        return [
+            row[0] for row in self.conn.execute(
+                'SELECT url FROM series WHERE status = ? ORDER BY position', (status,)
+            )
+        ]
+
+    def completed_series(self) -> List[str]:
+        return self.series_with_status(COMPLETED)
+
+    def leased_series(self) -> List[str]:
+        return self.series_with_status(LEASED)
+
+    def count_with_status(self, status: str) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM series WHERE status = ?', (status,)).fetchone()[0]
+
+    def lease_next(self, limit: int) -> List[str]:
+        """Aluga as próximas séries pendentes, na ordem da listagem"""
+        if limit <= 0:
+            return []
+
+        with self.transaction() as conn:
+            urls = [
+                row[0] for row in conn.execute(
+                    'SELECT url FROM series WHERE status = ? ORDER BY position LIMIT ?',
+                    (PENDING, limit)
+                )
+            ]
+            for url in urls:
+                self._set_status(url, LEASED)
+        return urls
+
+    def complete(self, url: str):
+        self._set_status(url, COMPLETED)
+
+    def release(self, url: str):
+        """Libera o aluguel sem concluir; a série volta na próxima execução"""
+        self._set_status(url, DEFERRED)
+
+    def reset_deferred(self):
+        """Devolve à fila as séries liberadas numa execução anterior"""
+        self.conn.execute('UPDATE series SET status = ? WHERE status = ?', (PENDING, DEFERRED))
+
+    def _set_status(self, url: str, status: str):
+        self.conn.execute(
+            'UPDATE series SET status = ?, updated_at = ? WHERE url = ?',
+            (status, datetime.now().isoformat(), url)
+        )
+
+    # Validadores HTTP das páginas de série (modo update)
+
+    def series_validators(self, url: str) -> Optional[dict]:
+        row = self.conn.execute(
+            'SELECT etag, last_modified, chapter_hash FROM series_http WHERE url = ?', (url,)
+        ).fetchone()
+        if not row:
+            return None
+        return {'etag': row[0], 'last_modified': row[1], 'chapter_hash': row[2]}
+
+    def set_series_validators(self, url: str, etag: Optional[str], last_modified: Optional[str],
+                              chapter_hash: str):
+        self.conn.execute(
+            'INSERT OR REPLACE INTO series_http (url, etag, last_modified, chapter_hash, checked_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (url, etag, last_modified, chapter_hash, datetime.now().isoformat())
+        )
+
+    # Manifesto de downloads (chave: nome da série já limpo, como no diretório)
+
+    def record_pages(self, series: str, chapter: float, pages: Dict[int, str],
+                     expected_pages: Optional[int] = None, url: Optional[str] = None,
+                     hashes: Optional[Dict[int, str]] = None, series_url: Optional[str] = None):
+        """Registra páginas gravadas de um capítulo e atualiza a contagem
+
+        O digest do capítulo é limpo, pois deixa de valer com páginas novas.
+        """
+        hashes = hashes or {}
+        with self.transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO pages (series, chapter, page, path, sha256) VALUES (?, ?, ?, ?, ?)',
+                [(series, chapter, page, path, hashes.get(page)) for page, path in pages.items()]
+            )
+            self._upsert_chapter(series, chapter, expected_pages, url, series_url)
+
+    def _upsert_chapter(self, series: str, chapter: float, expected_pages: Optional[int] = None,
+                        url: Optional[str] = None, series_url: Optional[str] = None):
+        stored = self.conn.execute(
+            'SELECT COUNT(*) FROM pages WHERE series = ? AND chapter = ?', (series, chapter)
+        ).fetchone()[0]
+        self.conn.execute(
+            'INSERT INTO chapters (series, chapter, expected_pages, stored_pages, url, series_url, updated_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(series, chapter) DO UPDATE SET '
+            'expected_pages = COALESCE(excluded.expected_pages, expected_pages), '
+            'stored_pages = excluded.stored_pages, '
+            'url = COALESCE(excluded.url, url), '
+            'series_url = COALESCE(excluded.series_url, series_url), '
+            'digest = NULL, '
+            'updated_at = excluded.updated_at',
+            (series, chapter, expected_pages, stored, url, series_url, datetime.now().isoformat())
+        )
+
+    def page_hashes(self, series: str, chapter: float) -> Dict[int, Optional[str]]:
+        """Hash SHA-256 de cada página gravada do capítulo"""
+        return dict(self.conn.execute(
+            'SELECT page, sha256 FROM pages WHERE series = ? AND chapter = ? ORDER BY page', (series, chapter)
+        ))
+
+    def set_chapter_digest(self, series: str, chapter: float, digest: Optional[str]):
+        self.conn.execute(
+            'UPDATE chapters SET digest = ? WHERE series = ? AND chapter = ?', (digest, series, chapter)
+        )
+
+    def iter_pages(self) -> Iterable[tuple]:
+        """Todas as páginas do manifesto: (série, capítulo, página, caminho, sha256)"""
+        return self.conn.execute(
+            'SELECT series, chapter, page, path, sha256 FROM pages ORDER BY series, chapter, page'
+        ).fetchall()
+
+    def remove_pages(self, pages: Iterable[tuple]) -> Set[str]:
+        """Remove páginas do manifesto para que sejam baixadas de novo
+
+        Recebe tuplas (série, capítulo, página) e retorna as URLs das séries
+        afetadas, que voltam à fila de downloads.
+        """
+        affected = set()
+        series_urls = set()
+        with self.transaction() as conn:
+            for series, chapter, page in pages:
+                conn.execute(
+                    'DELETE FROM pages WHERE series = ? AND chapter = ? AND page = ?', (series, chapter, page)
+                )
+                affected.add((series, chapter))
+
+            for series, chapter in affected:
+                self._upsert_chapter(series, chapter)
+                row = conn.execute(
+                    'SELECT series_url FROM chapters WHERE series = ? AND chapter = ?', (series, chapter)
+                ).fetchone()
+                if row and row[0]:
+                    series_urls.add(row[0])
+
+            for url in series_urls:
+                # Volta a 'pending' e descarta os validadores do modo update
+                self._set_status(url, PENDING)
+                conn.execute('DELETE FROM series_http WHERE url = ?', (url,))
+        return series_urls
+
+    def stored_pages(self, series: str, chapter: float) -> Dict[int, str]:
+        """Páginas já gravadas de um capítulo (página -> caminho)"""
+        return dict(self.conn.execute(
+            'SELECT page, path FROM pages WHERE series = ? AND chapter = ?', (series, chapter)
+        ))
+
+    def completed_chapters(self, series: str) -> Set[float]:
+        """Capítulos com todas as páginas esperadas gravadas
+
+        Capítulos importados do disco não têm contagem esperada e contam
+        como completos se tiverem ao menos uma página.
+        """
+        return {
+            row[0] for row in self.conn.execute(
+                'SELECT chapter FROM chapters WHERE series = ? AND stored_pages > 0 '
+                'AND (expected_pages IS NULL OR stored_pages >= expected_pages)',
+                (series,)
+            )
+        }
+
+    def import_downloads(self, root: str) -> bool:
+        """Importa uma única vez as páginas já existentes em downloads/"""
+        if self.get_meta('downloads_imported'):
+            return False
+
+        imported = 0
+        with self.transaction():
+            if os.path.isdir(root):
+                for series in os.listdir(root):
+                    series_path = os.path.join(root, series)
+                    if not os.path.isdir(series_path):
+                        continue
+                    for entry in os.listdir(series_path):
+                        match = CHAPTER_DIR_RE.match(entry) or CHAPTER_ARCHIVE_RE.match(entry)
+                        if not match:
+                            continue
+                        pages = {}
+                        for filename in self._chapter_files(os.path.join(series_path, entry)):
+                            if page_match := PAGE_FILE_RE.match(filename):
+                                pages[int(page_match.group(1))] = f"{series}/{entry}/{filename}"
+                        if pages:
+                            self.record_pages(series, float(match.group(1)), pages)
+                            imported += 1
+            self.set_meta('downloads_imported', datetime.now().isoformat())
+
+        if imported:
+            logger.info(f"Importados {imported} capítulos de {root} para o manifesto")
+        return True
+
+    @staticmethod
+    def _chapter_files(path: str) -> List[str]:
+        """Arquivos de um capítulo: pasta solta ou entradas do CBZ"""
+        if os.path.isdir(path):
+            return os.listdir(path)
+        try:
+            with zipfile.ZipFile(path) as archive:
+                return archive.namelist()
+        except (OSError, zipfile.BadZipFile):
+            return []
+
+    # Importação dos arquivos JSON antigos
+
+    def import_json(self, cache_dir: str) -> bool:
+        """Importa uma única vez series_cache.json e download_progress.json"""
+        if self.get_meta('json_imported'):
+            return False
+
+        series_cache = load_json(os.path.join(cache_dir, 'series_cache.json'), {'series': [], 'last_update': None})
+        progress = load_json(os.path.join(cache_dir, 'download_progress.json'), {'completed': []})
+
+        leased = list(progress.get('leased') or [])
+        if progress.get('in_progress'):
+            leased.append(progress['in_progress'])
+
+        with self.transaction():
+            # Séries concluídas que não estão na listagem também são preservadas
+            self.add_series(series_cache.get('series', []) + progress.get('completed', []) + leased)
+            for url in leased:
+                self._set_status(url, LEASED)
+            for url in progress.get('completed', []):
+                self._set_status(url, COMPLETED)
+            if series_cache.get('last_update'):
+                self.set_meta('last_update', series_cache['last_update'])
+            self.set_meta('json_imported', datetime.now().isoformat())
+
+        if self.series_count():
+            logger.info(f"Importadas {self.series_count()} séries dos arquivos JSON para {self.path}")
+        return True
+
+
+def load_json(filepath: str, default: dict) -> dict:
+    """Carrega um arquivo JSON de cache, recorrendo ao backup se estiver corrompido"""
+    backup_filepath = f"{filepath}.backup"
+
+    try:
+        if os.path.exists(filepath):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+    except json.JSONDecodeError:
+        logger.error(f"Erro ao carregar {filepath}, tentando backup...")
+        if os.path.exists(backup_filepath):
+            with open(backup_filepath, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+    return default
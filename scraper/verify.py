@@ -0,0 +1,176 @@
+"""Verificação de integridade da biblioteca baixada.
+
+Recalcula em paralelo (um processo por núcleo) o SHA-256 de cada página
+registrada no manifesto e lista as páginas ausentes ou corrompidas. Com
+--repair elas saem do manifesto e suas séries voltam à fila, para que o
+próximo `mode=download` baixe apenas essas páginas.
+
+Uso:
+    python -m scraper.verify [--workers N] [--repair]
+"""
+import argparse
+import json
+import logging
+import hashlib
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import List, Tuple
+
+from scraper.archive import split_archive_path
+from scraper.media import BlobStore, file_sha256, merkle_root, sniff_image_format
+from scraper.state import CrawlState
+
+logger = logging.getLogger(__name__)
+
+# (série, capítulo, página, caminho, sha256)
+PageRow = Tuple[str, float, int, str, str]
+
+
+def check_archive_page(store_root: str, path: str, expected: str, archives: dict) -> str:
+    """Confere uma página gravada dentro do CBZ do capítulo"""
+    archive, member = split_archive_path(path)
+    if archive not in archives:
+        try:
+            archives[archive] = zipfile.ZipFile(os.path.join(store_root, archive))
+        except (OSError, zipfile.BadZipFile):
+            archives[archive] = None
+    if archives[archive] is None:
+        return 'missing'
+
+    try:
+        data = archives[archive].read(member)
+    except KeyError:
+        return 'missing'
+    except (zipfile.BadZipFile, OSError):
+        return 'corrupt'
+
+    if expected:
+        return 'corrupt' if hashlib.sha256(data).hexdigest() != expected else None
+    return 'invalid' if sniff_image_format(data) is None else None
+
+
+def check_pages(store_root: str, rows: List[PageRow]) -> Tuple[int, List[dict]]:
+    """Confere um lote de páginas; roda nos processos do pool"""
+    problems = []
+    archives = {}
+    for series, chapter, page, path, expected in rows:
+        full_path = os.path.join(store_root, path)
+        problem = None
+
+        if split_archive_path(path):
+            problem = check_archive_page(store_root, path, expected, archives)
+        elif not os.path.isfile(full_path):
+            problem = 'missing'
+        elif expected:
+            if file_sha256(full_path) != expected:
+                problem = 'corrupt'
+        else:
+            # Páginas importadas do disco não têm hash: confere ao menos o formato
+            with open(full_path, 'rb') as f:
+                if sniff_image_format(f.read(32)) is None:
+                    problem = 'invalid'
+
+        if problem:
+            problems.append({
+                'series': series,
+                'chapter': chapter,
+                'page': page,
+                'path': path,
+                'sha256': expected,
+                'problem': problem
+            })
+
+    for archive in archives.values():
+        if archive is not None:
+            archive.close()
+    return len(rows), problems
+
+
+def check_digests(state: CrawlState) -> List[dict]:
+    """Confere o digest Merkle gravado de cada capítulo contra os hashes das páginas"""
+    mismatches = []
+    rows = state.conn.execute('SELECT series, chapter, digest FROM chapters WHERE digest IS NOT NULL').fetchall()
+    for series, chapter, digest in rows:
+        hashes = state.page_hashes(series, chapter)
+        if not all(hashes.values()) or merkle_root(list(hashes.values())) != digest:
+            mismatches.append({'series': series, 'chapter': chapter, 'problem': 'digest_mismatch'})
+    return mismatches
+
+
+def verify_library(state: CrawlState, store_root: str, workers: int = None, batch_size: int = 500) -> dict:
+    rows = state.iter_pages()
+    batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+
+    checked = 0
+    problems = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(check_pages, store_root, batch) for batch in batches]
+        for future in futures:
+            count, batch_problems = future.result()
+            checked += count
+            problems.extend(batch_problems)
+
+    return {
+        'checked_pages': checked,
+        'missing': [p for p in problems if p['problem'] == 'missing'],
+        'corrupt': [p for p in problems if p['problem'] in ('corrupt', 'invalid')],
+        'digest_mismatches': check_digests(state),
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+def remove_bad_files(store_root: str, corrupt: List[dict]):
+    """Apaga páginas corrompidas e seus blobs para que sejam regravados"""
+    blob_store = BlobStore(store_root)
+    for problem in corrupt:
+        # Entradas de CBZ são descartadas quando o capítulo é regravado
+        if split_archive_path(problem['path']):
+            continue
+        full_path = os.path.join(store_root, problem['path'])
+        ext = os.path.splitext(problem['path'])[1].lstrip('.')
+        # O blob compartilhado tem o mesmo conteúdo corrompido da página
+        blob_path = blob_store.blob_path(problem['sha256'], ext) if problem['sha256'] else None
+        for path in (full_path, blob_path):
+            if path and os.path.isfile(path):
+                os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verificação de integridade da biblioteca')
+    parser.add_argument('--cache-dir', default='cache', help='Diretório de cache (padrão: cache)')
+    parser.add_argument('--store', default='downloads', help='Diretório das imagens (padrão: downloads)')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Processos em paralelo (padrão: núcleos)')
+    parser.add_argument('--repair', action='store_true',
+                        help='Remove as páginas com problema do manifesto e recoloca as séries na fila')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    state = CrawlState(os.path.join(args.cache_dir, 'state.db'))
+    report = verify_library(state, args.store, workers=args.workers)
+
+    bad_pages = report['missing'] + report['corrupt']
+    logger.info(
+        f"Verificadas {report['checked_pages']} páginas: {len(report['missing'])} ausentes, "
+        f"{len(report['corrupt'])} corrompidas, {len(report['digest_mismatches'])} digests divergentes"
+    )
+
+    if args.repair and bad_pages:
+        remove_bad_files(args.store, report['corrupt'])
+        requeued = state.remove_pages((p['series'], p['chapter'], p['page']) for p in bad_pages)
+        report['requeued_series'] = sorted(requeued)
+        logger.info(f"{len(bad_pages)} páginas removidas do manifesto; {len(requeued)} séries voltaram à fila")
+
+    report_dir = os.path.join(args.cache_dir, 'report')
+    os.makedirs(report_dir, exist_ok=True)
+    report_file = os.path.join(report_dir, f'verify_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    logger.info(f"Relatório salvo em {report_file}")
+    state.close()
+
+
+if __name__ == '__main__':
+    main()
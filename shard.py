@@ -0,0 +1,208 @@
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from scraper.state import CrawlState
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [shard] %(levelname)s: %(message)s')
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Campos numéricos dos relatórios do spider somados entre os shards
+SUMMED_FIELDS = (
+    'processed_series', 'downloaded_chapters', 'failed_downloads', 'unchanged_series',
+    'dedup_bytes_saved', 'httpcache_hits', 'httpcache_misses', 'transcode_pages',
+    'transcode_cpu_seconds', 'transcode_bytes_saved', 'total_bytes',
+)
+
+
+def shard_of(url: str, shards: int) -> int:
+    """Shard estável da série: não depende da ordem da listagem nem da execução"""
+    return int(hashlib.sha1(url.encode('utf-8')).hexdigest()[:8], 16) % shards
+
+
+def shard_dir(cache_dir: str, index: int) -> str:
+    return os.path.join(cache_dir, 'shards', f'shard_{index:02d}')
+
+
+def partition(cache_dir: str, shards: int) -> Dict[int, int]:
+    """Distribui as séries do state.db principal entre os state.db dos shards
+
+    Séries já presentes num shard mantêm o status dele; as novas entram com o
+    status do estado principal (concluídas continuam concluídas).
+    """
+    # Mudar a quantidade de shards mudaria o shard de quase todas as séries
+    configured = len(glob.glob(os.path.join(cache_dir, 'shards', 'shard_*')))
+    if configured and configured != shards:
+        raise SystemExit(
+            f"O cache já foi dividido em {configured} shards; use --shards {configured} "
+            f"ou apague {os.path.join(cache_dir, 'shards')} para redistribuir"
+        )
+
+    main_state = CrawlState(os.path.join(cache_dir, 'state.db'))
+    main_state.import_json(cache_dir)
+
+    buckets: Dict[int, List[str]] = {index: [] for index in range(shards)}
+    for url in main_state.all_series():
+        buckets[shard_of(url, shards)].append(url)
+
+    counts = {}
+    for index, urls in buckets.items():
+        directory = shard_dir(cache_dir, index)
+        os.makedirs(directory, exist_ok=True)
+        state = CrawlState(os.path.join(directory, 'state.db'))
+        with state.transaction():
+            for url in state.add_series(urls):
+                if main_state.is_completed(url):
+                    state.complete(url)
+        counts[index] = len(urls)
+        state.close()
+
+    main_state.close()
+    return counts
+
+
+def shard_command(index: int, args) -> List[str]:
+    directory = shard_dir(args.cache_dir, index)
+    command = [
+        sys.executable, '-m', 'scrapy', 'crawl', 'series_spider',
+        '-a', f'mode={args.mode}',
+        '-a', f'cache_dir={directory}',
+        '-s', f'IMAGES_STORE={os.path.join(args.output, f"shard_{index:02d}")}',
+        '-s', f'HTTPCACHE_DIR={os.path.join(directory, "httpcache")}',
+        '-s', f'RANGE_RESUME_DIR={os.path.join(directory, "partial")}',
+        '-s', f'METRICS_PORT={args.metrics_port + index if args.metrics_port else 0}',
+        '-s', f'LOG_FILE={os.path.join(directory, "spider.log")}',
+    ]
+    if args.base_url:
+        command += ['-a', f'base_url={args.base_url}']
+    return command
+
+
+def run_shards(indexes: List[int], args) -> Dict[int, int]:
+    """Roda um processo por shard e reinicia os que caírem, até --max-restarts vezes"""
+    env = dict(os.environ, SCRAPY_SETTINGS_MODULE='scraper.settings')
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT_DIR, env.get('PYTHONPATH')]))
+
+    restarts = {index: 0 for index in indexes}
+    exit_codes = {}
+    running = {}
+
+    def start(index):
+        logger.info(f"Iniciando shard {index}")
+        running[index] = subprocess.Popen(shard_command(index, args), env=env)
+
+    for index in indexes:
+        start(index)
+
+    while running:
+        for index, process in list(running.items()):
+            code = process.poll()
+            if code is None:
+                continue
+            del running[index]
+            if code != 0 and restarts[index] < args.max_restarts:
+                # O estado do shard é retomável: as séries alugadas voltam primeiro
+                restarts[index] += 1
+                logger.warning(f"Shard {index} saiu com código {code}; reiniciando ({restarts[index]}/{args.max_restarts})")
+                start(index)
+            else:
+                exit_codes[index] = code
+                logger.info(f"Shard {index} finalizado com código {code}")
+        time.sleep(0.5)
+    return exit_codes
+
+
+def latest_report(cache_dir: str, index: int, mode: str, since: float) -> Optional[dict]:
+    """Relatório mais recente do shard gerado nesta execução"""
+    pattern = os.path.join(shard_dir(cache_dir, index), 'report', f'report_{mode}_*.json')
+    reports = [path for path in glob.glob(pattern) if os.path.getmtime(path) >= since]
+    if not reports:
+        return None
+    with open(max(reports, key=os.path.getmtime), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def merge_reports(reports: Dict[int, Optional[dict]], exit_codes: Dict[int, int], mode: str, elapsed: float) -> dict:
+    merged = {field: 0 for field in SUMMED_FIELDS}
+    for report in filter(None, reports.values()):
+        for field in SUMMED_FIELDS:
+            merged[field] += report.get(field) or 0
+
+    merged.update({
+        'mode': mode,
+        'sharded': True,
+        'shards': len(reports),
+        'duration': str(timedelta(seconds=round(elapsed))),
+        'average_speed': f"{merged['total_bytes'] / elapsed / 1024:.2f} KB/s" if elapsed > 0 else "N/A",
+        'per_shard': {
+            str(index): {
+                'exit_code': exit_codes.get(index),
+                'finish_reason': report.get('finish_reason') if report else None,
+                'processed_series': report.get('processed_series') if report else None,
+                'duration': report.get('duration') if report else None,
+            }
+            for index, report in sorted(reports.items())
+        },
+        'timestamp': datetime.now().isoformat()
+    })
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Crawl dividido em shards, um processo por shard')
+    parser.add_argument('--shards', '-n', type=int, default=os.cpu_count() or 1,
+                        help='Quantidade de shards (padrão: núcleos da máquina)')
+    parser.add_argument('--shard', type=int, action='append',
+                        help='Roda só este shard (pode repetir); útil para reiniciar um shard que caiu')
+    parser.add_argument('--mode', '-m', default='download', choices=['download', 'update'],
+                        help='Modo do spider (padrão: download)')
+    parser.add_argument('--cache-dir', default='cache', help='Diretório de cache (padrão: cache)')
+    parser.add_argument('--output', '-o', default='downloads',
+                        help='Raiz das imagens; cada shard grava em <output>/shard_NN (padrão: downloads)')
+    parser.add_argument('--max-restarts', type=int, default=2, help='Reinícios automáticos por shard')
+    parser.add_argument('--metrics-port', type=int, default=9410,
+                        help='Porta de métricas do shard 0; os demais usam as seguintes (0 desliga)')
+    parser.add_argument('--base-url', help='URL base da listagem (padrão: a do spider)')
+    args = parser.parse_args()
+
+    counts = partition(args.cache_dir, args.shards)
+    logger.info("Séries por shard: " + ', '.join(f"{index}={count}" for index, count in counts.items()))
+
+    indexes = sorted(set(args.shard)) if args.shard else list(range(args.shards))
+    invalid = [index for index in indexes if not 0 <= index < args.shards]
+    if invalid:
+        raise SystemExit(f"Shards inválidos: {invalid} (use 0 a {args.shards - 1})")
+
+    started = time.time()
+    exit_codes = run_shards(indexes, args)
+    elapsed = time.time() - started
+
+    reports = {index: latest_report(args.cache_dir, index, args.mode, started) for index in indexes}
+    merged = merge_reports(reports, exit_codes, args.mode, elapsed)
+
+    report_dir = os.path.join(args.cache_dir, 'report')
+    os.makedirs(report_dir, exist_ok=True)
+    report_file = os.path.join(report_dir, f'report_{args.mode}_sharded_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump(merged, f, indent=2)
+    logger.info(f"Relatório consolidado salvo em {report_file}")
+
+    failed = [index for index, code in exit_codes.items() if code != 0]
+    if failed:
+        logger.error(f"Shards com falha: {failed}. Reinicie com: python shard.py --shards {args.shards} "
+                     + ' '.join(f'--shard {index}' for index in failed))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()